@@ -0,0 +1,125 @@
+import base64
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+from urllib.parse import unquote_to_bytes
+from pydantic import BaseModel
+from log import get_logger
+from metrics import timed
+
+log = get_logger(__name__)
+
+# 64 KiB of decoded output per step; must stay a multiple of 4 base64 characters
+CHUNK_CHARS=4*16*1024
+
+
+class StoredAttachment(BaseModel):
+    name: str
+    path: str
+    sha256: str
+    mime: str
+    size: int
+
+    @property
+    def is_image(self):
+        return self.mime.startswith("image/")
+
+
+def _split_data_uri(url):
+    if not url.startswith("data:") or "," not in url:
+        raise ValueError("Attachment url is not a data URI")
+    header, payload = url[5:].split(",", 1)
+    parts = header.split(";")
+    mime = parts[0] or "text/plain"
+    return mime, "base64" in parts[1:], payload
+
+
+def decode_to_file(url, dest_dir, name):
+    """
+    Decodes a data URI once, in chunks, into dest_dir/<sha256><ext> while
+    hashing it. Identical content maps to the same file, so a repeated
+    attachment is stored only once.
+    """
+    mime, is_base64, payload = _split_data_uri(url)
+    os.makedirs(dest_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, prefix=".ingest-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            if is_base64:
+                if "\n" in payload or "\r" in payload or " " in payload:
+                    # Line-wrapped base64 would break the chunk alignment
+                    payload = "".join(payload.split())
+                for start in range(0, len(payload), CHUNK_CHARS):
+                    chunk = base64.b64decode(payload[start:start + CHUNK_CHARS])
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            else:
+                chunk = unquote_to_bytes(payload)
+                digest.update(chunk)
+                out.write(chunk)
+                size = len(chunk)
+        sha = digest.hexdigest()
+        ext = os.path.splitext(name)[1].lower() or (mimetypes.guess_extension(mime) or "")
+        path = os.path.join(dest_dir, sha + ext)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return StoredAttachment(name=name, path=path, sha256=sha, mime=mime, size=size)
+
+
+def decoded_size(url):
+    """Upper bound of the decoded size of a data URI, computed without decoding it."""
+    _, is_base64, payload = _split_data_uri(url)
+    return len(payload) * 3 // 4 if is_base64 else len(payload)
+
+
+def safe_name(name):
+    """File name part of a client-supplied attachment name, so it cannot point outside the job directory."""
+    name = os.path.basename(str(name).replace("\\", "/"))
+    if name in ("", ".", ".."):
+        raise ValueError("Attachment name is empty")
+    return name
+
+
+def ingest_attachments(attachments, dest_dir, reserve=None):
+    """
+    Decodes every request attachment to disk exactly once. Returns a list of StoredAttachment.
+    reserve, when given, is called with each attachment's size before it is written.
+    """
+    stored = []
+    with timed("decode"):
+        for attachment in attachments:
+            if reserve:
+                reserve(decoded_size(attachment["url"]))
+            stored.append(decode_to_file(attachment["url"], dest_dir, safe_name(attachment["name"])))
+            log.info("Saved attachment", extra={"attachment": stored[-1].name, "bytes": stored[-1].size})
+    return stored
+
+
+def copy_attachments(stored, dest_dir):
+    """Places the decoded files under their original names in dest_dir (hard link when possible)."""
+    for attachment in stored:
+        target = os.path.join(dest_dir, safe_name(attachment.name))
+        os.makedirs(dest_dir, exist_ok=True)
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(attachment.path, target)
+        except OSError:
+            shutil.copyfile(attachment.path, target)
+
+
+def image_data_uri(attachment):
+    """Builds the data URI for an image part of the LLM request from the decoded file."""
+    with open(attachment.path, "rb") as f:
+        return f"data:{attachment.mime};base64,{base64.b64encode(f.read()).decode('ascii')}"
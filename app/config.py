@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -6,4 +7,113 @@ load_dotenv()
 GITHUB_TOKEN=os.getenv("GITHUB_TOKEN")
 BASE_GITHUB_ORG=os.getenv('GITHUB_ORG')
 SERVER_SECRET=os.getenv("SERVER_SECRET")
-GITHUB_API="https://api.github.com"
+# Upstream endpoints; point them (and LLM_API_URL below) at loadtest/fakes.py for local load tests
+GITHUB_API=os.getenv("GITHUB_API","https://api.github.com")
+
+# Job queue: number of concurrent pipeline workers and how many jobs may wait
+JOB_WORKERS=int(os.getenv("JOB_WORKERS","2"))
+JOB_QUEUE_SIZE=int(os.getenv("JOB_QUEUE_SIZE","20"))
+
+# Shared outbound HTTP client
+HTTP_MAX_CONNECTIONS=int(os.getenv("HTTP_MAX_CONNECTIONS","100"))
+HTTP_MAX_KEEPALIVE=int(os.getenv("HTTP_MAX_KEEPALIVE","20"))
+HTTP_MAX_PER_HOST=int(os.getenv("HTTP_MAX_PER_HOST","10"))
+HTTP_CONNECT_TIMEOUT=float(os.getenv("HTTP_CONNECT_TIMEOUT","10"))
+HTTP_TIMEOUT=float(os.getenv("HTTP_TIMEOUT","30"))
+LLM_TIMEOUT=float(os.getenv("LLM_TIMEOUT","300"))
+
+# How generated sites are published: "api" builds the commit through the
+# GitHub Git Data API, "git" clones and pushes with the git CLI
+PUBLISH_BACKEND=os.getenv("PUBLISH_BACKEND","api")
+PUBLISH_BRANCH=os.getenv("PUBLISH_BRANCH","main")
+
+# On-disk cache of the last published tree per task, reused by round 2
+SNAPSHOT_CACHE_DIR=os.getenv("SNAPSHOT_CACHE_DIR",os.path.join(tempfile.gettempdir(),"snapshot-cache"))
+SNAPSHOT_CACHE_MAX_BYTES=int(os.getenv("SNAPSHOT_CACHE_MAX_BYTES",str(500*1024*1024)))
+
+# Persistent store of published repos per (email, task)
+TASK_STORE_PATH=os.getenv("TASK_STORE_PATH",os.path.join(tempfile.gettempdir(),"tasks.db"))
+TASK_STORE_CACHE_TTL=float(os.getenv("TASK_STORE_CACHE_TTL","60"))
+
+# Evaluator outbox: pending notifications survive restarts and are retried until the deadline
+OUTBOX_PATH=os.getenv("OUTBOX_PATH",os.path.join(tempfile.gettempdir(),"outbox.db"))
+OUTBOX_DEADLINE=float(os.getenv("OUTBOX_DEADLINE","600"))
+OUTBOX_BACKOFF_BASE=float(os.getenv("OUTBOX_BACKOFF_BASE","1"))
+OUTBOX_BACKOFF_MAX=float(os.getenv("OUTBOX_BACKOFF_MAX","60"))
+OUTBOX_PER_URL=int(os.getenv("OUTBOX_PER_URL","2"))
+OUTBOX_POLL_INTERVAL=float(os.getenv("OUTBOX_POLL_INTERVAL","5"))
+OUTBOX_KEEP_DELIVERED=float(os.getenv("OUTBOX_KEEP_DELIVERED","86400"))
+# A claimed row is left to its dispatcher this long before another process may retry it
+OUTBOX_LEASE=float(os.getenv("OUTBOX_LEASE","120"))
+
+# Per-job scratch space. WORKSPACE_TMPFS places it in /dev/shm when available.
+WORKSPACE_ROOT=os.getenv("WORKSPACE_ROOT",tempfile.gettempdir())
+WORKSPACE_TMPFS=os.getenv("WORKSPACE_TMPFS","false").lower()=="true"
+WORKSPACE_QUOTA_BYTES=int(os.getenv("WORKSPACE_QUOTA_BYTES",str(200*1024*1024)))
+
+# Attachment profiling: "sample" reads only what the prompt needs, "full" loads whole files
+ATTACHMENT_PROFILE_MODE=os.getenv("ATTACHMENT_PROFILE_MODE","sample")
+ATTACHMENT_SAMPLE_ROWS=int(os.getenv("ATTACHMENT_SAMPLE_ROWS","3"))
+
+# Attachments are processed in a process pool when there are several of them
+ATTACHMENT_WORKERS=int(os.getenv("ATTACHMENT_WORKERS",str(min(4,os.cpu_count() or 1))))
+ATTACHMENT_TIMEOUT=float(os.getenv("ATTACHMENT_TIMEOUT","60"))
+
+# OCR: backend is tesseract or easyocr; the model is loaded once per process and shared by OCR_WORKERS threads
+OCR_BACKEND=os.getenv("OCR_BACKEND","tesseract").lower()
+OCR_LANGS=os.getenv("OCR_LANGS","en")
+OCR_WORKERS=int(os.getenv("OCR_WORKERS","2"))
+OCR_TIMEOUT=float(os.getenv("OCR_TIMEOUT","30"))
+
+# Content-addressed caches (attachment profiles/OCR, LLM responses, image variants)
+CACHE_DIR=os.getenv("CACHE_DIR",os.path.join(tempfile.gettempdir(),"app-cache"))
+PROFILE_CACHE_MAX_BYTES=int(os.getenv("PROFILE_CACHE_MAX_BYTES",str(100*1024*1024)))
+LLM_CACHE_MAX_BYTES=int(os.getenv("LLM_CACHE_MAX_BYTES",str(50*1024*1024)))
+LLM_CACHE_TTL=float(os.getenv("LLM_CACHE_TTL",str(24*3600)))
+
+# Image variants: a size-capped re-encode for the LLM and a grayscale copy for OCR, cached by content hash
+IMAGE_CACHE_MAX_BYTES=int(os.getenv("IMAGE_CACHE_MAX_BYTES",str(200*1024*1024)))
+IMAGE_LLM_MAX_EDGE=int(os.getenv("IMAGE_LLM_MAX_EDGE","1536"))
+IMAGE_LLM_QUALITY=int(os.getenv("IMAGE_LLM_QUALITY","85"))
+IMAGE_LLM_DETAIL=os.getenv("IMAGE_LLM_DETAIL","auto")
+IMAGE_OCR_DPI=int(os.getenv("IMAGE_OCR_DPI","300"))
+IMAGE_OCR_SOURCE_DPI=int(os.getenv("IMAGE_OCR_SOURCE_DPI","0"))
+IMAGE_OCR_MAX_EDGE=int(os.getenv("IMAGE_OCR_MAX_EDGE","2500"))
+
+# Prompt size control: prompts are degraded step by step until they fit
+LLM_PROMPT_TOKEN_BUDGET=int(os.getenv("LLM_PROMPT_TOKEN_BUDGET","12000"))
+
+# Stream completions and extract index.html while tokens arrive
+LLM_STREAM=os.getenv("LLM_STREAM","false").lower()=="true"
+LLM_STREAM_ABORT_CHARS=int(os.getenv("LLM_STREAM_ABORT_CHARS","2000"))
+
+# LLM backend: ordered fallback targets, each "model" or "model@completions_url"
+LLM_API_URL=os.getenv("LLM_API_URL","https://aipipe.org/openai/v1/chat/completions")
+LLM_GENERATE_TARGETS=os.getenv("LLM_GENERATE_TARGETS","gpt-5-mini,gpt-5-nano")
+LLM_REVISE_TARGETS=os.getenv("LLM_REVISE_TARGETS","gpt-5-nano,gpt-5-mini")
+LLM_MAX_RETRIES=int(os.getenv("LLM_MAX_RETRIES","2"))
+LLM_BACKOFF_BASE=float(os.getenv("LLM_BACKOFF_BASE","1"))
+LLM_BACKOFF_MAX=float(os.getenv("LLM_BACKOFF_MAX","20"))
+# Hedging: after a target has been in flight longer than this latency
+# percentile of its recent calls, fire the same request at the next target
+LLM_HEDGE=os.getenv("LLM_HEDGE","false").lower()=="true"
+LLM_HEDGE_PERCENTILE=float(os.getenv("LLM_HEDGE_PERCENTILE","0.9"))
+LLM_HEDGE_MIN_SAMPLES=int(os.getenv("LLM_HEDGE_MIN_SAMPLES","20"))
+
+# Outbound rate limits per upstream: sustained requests/second, burst size, max in flight
+LLM_RATE=float(os.getenv("LLM_RATE","2"))
+LLM_BURST=int(os.getenv("LLM_BURST","4"))
+LLM_MAX_IN_FLIGHT=int(os.getenv("LLM_MAX_IN_FLIGHT","8"))
+GITHUB_RATE=float(os.getenv("GITHUB_RATE","5"))
+GITHUB_BURST=int(os.getenv("GITHUB_BURST","10"))
+GITHUB_MAX_IN_FLIGHT=int(os.getenv("GITHUB_MAX_IN_FLIGHT","8"))
+EVALUATOR_RATE=float(os.getenv("EVALUATOR_RATE","10"))
+EVALUATOR_BURST=int(os.getenv("EVALUATOR_BURST","10"))
+EVALUATOR_MAX_IN_FLIGHT=int(os.getenv("EVALUATOR_MAX_IN_FLIGHT","8"))
+
+# Logging: LOG_LEVEL is DEBUG, INFO, WARNING, ERROR or OFF; LOG_FORMAT is text or json
+LOG_LEVEL=os.getenv("LOG_LEVEL","INFO").upper()
+LOG_FORMAT=os.getenv("LOG_FORMAT","text").lower()
+
+# Startup: modules imported in the background once the app is serving, "" to disable
+WARMUP_MODULES=os.getenv("WARMUP_MODULES","numpy,pandas,cv2,bs4,tiktoken,ocr")
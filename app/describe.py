@@ -0,0 +1,196 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from config import ATTACHMENT_PROFILE_MODE, ATTACHMENT_SAMPLE_ROWS, OCR_BACKEND
+from disk_cache import file_sha256, make_key
+from file_handling import process_attachments, TableProfile, DatabaseProfile, ImageProfile, table_profile, is_dataframe
+from log import get_logger
+import ocr
+
+# Turns process_attachments output into the data description placed in the
+# LLM prompt. Each kind of value has a handler, tried in registration order;
+# the first whose predicate matches (name, data) builds the entry. Entries
+# are memoized per attachment content, and serialize() renders the whole
+# description as compact JSON so the prompt is deterministic.
+
+log = get_logger(__name__)
+
+# Bump when handlers change what they produce
+DESCRIBE_VERSION = 2
+MAX_STRING = 200
+MAX_ITEMS = 5
+# Key names listed for a JSON object, and entries of it shown with their values
+MAX_KEYS = 20
+SAMPLE_ENTRIES = 2
+MEMO_SIZE = 256
+
+_PDF_PAGE_RE = re.compile(rb"/Type\s*/Page\b")
+
+HANDLERS = []
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def handler(predicate):
+    """Registers fn(name, data) -> dict for values where predicate(name, data) is true."""
+    def register(fn):
+        HANDLERS.append((predicate, fn))
+        return fn
+    return register
+
+
+def truncate(value, depth=2):
+    """Shortens strings and containers so a sample value stays a few hundred characters at most."""
+    if isinstance(value, str):
+        return value if len(value) <= MAX_STRING else value[:MAX_STRING] + "..."
+    if isinstance(value, dict):
+        if depth <= 0:
+            return f"{{... {len(value)} keys}}"
+        items = list(value.items())
+        out = {str(k): truncate(v, depth - 1) for k, v in items[:MAX_ITEMS]}
+        if len(items) > MAX_ITEMS:
+            out["..."] = f"{len(items) - MAX_ITEMS} more keys"
+        return out
+    if isinstance(value, (list, tuple)):
+        if depth <= 0:
+            return f"[... {len(value)} items]"
+        out = [truncate(v, depth - 1) for v in value[:MAX_ITEMS]]
+        if len(value) > MAX_ITEMS:
+            out.append(f"... {len(value) - MAX_ITEMS} more items")
+        return out
+    return value
+
+
+def _ext(name):
+    return name.rsplit(".", 1)[-1].lower() if "." in name else ""
+
+
+@handler(lambda name, data: isinstance(data, (TableProfile, DatabaseProfile, ImageProfile)))
+def describe_profile(name, data):
+    return data.describe()
+
+
+@handler(lambda name, data: is_dataframe(data))
+def describe_dataframe(name, data):
+    return table_profile("dataframe", data.head(ATTACHMENT_SAMPLE_ROWS), len(data)).describe()
+
+
+@handler(lambda name, data: isinstance(data, dict) and bool(data) and all(is_dataframe(v) for v in data.values()))
+def describe_database(name, data):
+    return DatabaseProfile(tables={
+        table: table_profile("sqlite", df.head(ATTACHMENT_SAMPLE_ROWS), len(df)) for table, df in data.items()
+    }).describe()
+
+
+@handler(lambda name, data: _ext(name) == "pdf" and isinstance(data, str))
+def describe_pdf(name, data):
+    entry = {"type": "PDF", "size_bytes": os.path.getsize(data)}
+    with open(data, "rb") as f:
+        # Page objects, without parsing the document
+        pages = len(_PDF_PAGE_RE.findall(f.read()))
+    if pages:
+        entry["pages"] = pages
+    return entry
+
+
+@handler(lambda name, data: isinstance(data, dict))
+def describe_json_object(name, data):
+    keys = list(data.keys())
+    entry = {"type": "JSON object", "key_count": len(keys), "keys": keys[:MAX_KEYS]}
+    entry["sample"] = truncate(dict(list(data.items())[:SAMPLE_ENTRIES]))
+    return entry
+
+
+@handler(lambda name, data: isinstance(data, list))
+def describe_json_array(name, data):
+    entry = {"type": "JSON array", "length": len(data), "sample": [truncate(item) for item in data[:SAMPLE_ENTRIES]]}
+    item_types = sorted({type(item).__name__ for item in data[:100]})
+    if len(item_types) > 1:
+        # Only worth spelling out when the sample does not show it
+        entry["item_types"] = item_types
+    return entry
+
+
+@handler(lambda name, data: isinstance(data, str))
+def describe_text(name, data):
+    return {"type": "Markdown" if _ext(name) == "md" else "Text", "length": len(data), "sample": truncate(data)}
+
+
+@handler(lambda name, data: type(data).__name__ == "ndarray")
+def describe_image(name, data):
+    height, width = data.shape[:2]
+    try:
+        text, engine = ocr.read_text(data)
+    except Exception as e:
+        return {"type": "Image", "size": (width, height), "error": f"OCR failed: {e}"}
+    return {"type": "Image", "size": (width, height), "ocr_text_sample": truncate(text), "info": f"OCR processed with {engine.capitalize()}"}
+
+
+def describe_value(name, data):
+    """Description entry for one processed attachment."""
+    if data is None:
+        return {"type": _ext(name) or "file", "info": "Could not be read"}
+    for predicate, fn in HANDLERS:
+        if predicate(name, data):
+            return fn(name, data)
+    return {"type": type(data).__name__, "info": "Available for processing"}
+
+
+def _memo_key(name, path, mode, sample_rows):
+    return make_key("describe", DESCRIBE_VERSION, file_sha256(path), _ext(name), mode, sample_rows, OCR_BACKEND, MAX_STRING, MAX_ITEMS, MAX_KEYS, SAMPLE_ENTRIES)
+
+
+def describe_attachments(file_paths, mode=ATTACHMENT_PROFILE_MODE, sample_rows=ATTACHMENT_SAMPLE_ROWS):
+    """
+    Returns {filename: entry} for the given attachments, in their order,
+    or "None" when there are none. Only attachments not described before
+    (by content) go through process_attachments.
+    """
+    if not file_paths:
+        return "None"
+    described = {}
+    keys = {}
+    pending = {}
+    for name, path in file_paths.items():
+        if not os.path.exists(path):
+            continue
+        keys[name] = _memo_key(name, path, mode, sample_rows)
+        with _memo_lock:
+            entry = _memo.get(keys[name])
+            if entry is not None:
+                _memo.move_to_end(keys[name])
+        if entry is not None:
+            described[name] = json.loads(entry)
+        else:
+            pending[name] = path
+    log.debug("Description memo lookup", extra={"hits": len(described), "misses": len(pending)})
+
+    if pending:
+        processed = process_attachments(pending, mode, sample_rows)
+        for name in pending:
+            if name not in processed:
+                # No loader for this file type; it is still published with the app
+                continue
+            data = processed[name]
+            entry = describe_value(name, data)
+            described[name] = entry
+            if data is not None and "error" not in entry:
+                with _memo_lock:
+                    # Stored serialized: callers get their own copy, and json is cheaper than deepcopy
+                    _memo[keys[name]] = json.dumps(entry, ensure_ascii=False, default=str)
+                    while len(_memo) > MEMO_SIZE:
+                        _memo.popitem(last=False)
+
+    description = {name: described[name] for name in file_paths if name in described}
+    log.debug("Data description: %s", description)
+    return description or "None"
+
+
+def serialize(description):
+    """Compact JSON for the prompt; strings are passed through unchanged."""
+    if isinstance(description, str):
+        return description
+    return json.dumps(description, ensure_ascii=False, separators=(",", ":"), default=str)
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from metrics import CACHE_REQUESTS, CACHE_BYTES, CACHE_EVICTIONS
+
+
+_sha_memo={}
+_sha_lock=threading.Lock()
+
+
+def file_sha256(path):
+    # The same attachment is hashed by several caches during a job; remember
+    # the digest for as long as the file's size and mtime are unchanged
+    st=os.stat(path)
+    memo_key=(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _sha_lock:
+        digest=_sha_memo.get(memo_key)
+    if digest:
+        return digest
+    sha=hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024*1024), b""):
+            sha.update(chunk)
+    digest=sha.hexdigest()
+    with _sha_lock:
+        if len(_sha_memo)>=1024:
+            _sha_memo.clear()
+        _sha_memo[memo_key]=digest
+    return digest
+
+
+def make_key(*parts):
+    """Hashes the given parts (strings, numbers, JSON-serialisable values) into a cache key."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    Small file-per-entry cache. Entries live at <directory>/<key[:2]>/<key>
+    and are written atomically. The mtime records when an entry was written
+    (entries older than ttl seconds, when set, are misses) and a read bumps
+    the atime, so the least recently read entries are evicted first once the
+    directory grows past max_bytes.
+    Several processes may share a directory; the size total is per process
+    and is re-synchronised from disk on every eviction pass.
+    """
+
+    def __init__(self, directory, max_bytes, ttl=None, name="cache"):
+        self.directory=directory
+        self.max_bytes=max_bytes
+        self.ttl=ttl
+        self.name=name
+        self._lock=threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size=sum(size for _, _, size in self._entries())
+        CACHE_BYTES.labels(name).set(self._size)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+                path=os.path.join(root, name)
+                try:
+                    stat=os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_atime, path, stat.st_size
+
+    def get(self, key):
+        path=self._path(key)
+        try:
+            written=os.stat(path).st_mtime
+            if self.ttl is not None and time.time()-written>self.ttl:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "rb") as f:
+                value=f.read()
+            os.utime(path, (time.time(), written))
+        except FileNotFoundError:
+            CACHE_REQUESTS.labels(self.name, "miss").inc()
+            return None
+        CACHE_REQUESTS.labels(self.name, "hit").inc()
+        return value
+
+    def set(self, key, value):
+        path=self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp=tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(value)
+        os.replace(tmp, path)
+        with self._lock:
+            self._size+=len(value)
+            if self._size>self.max_bytes:
+                self._evict()
+            CACHE_BYTES.labels(self.name).set(self._size)
+
+    def get_json(self, key):
+        value=self.get(key)
+        return None if value is None else json.loads(value)
+
+    def set_json(self, key, value):
+        self.set(key, json.dumps(value).encode("utf-8"))
+
+    def _evict(self):
+        # Called with _lock held; evict down to 90% so we don't rescan on every write
+        entries=sorted(self._entries())
+        total=sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total<=self.max_bytes*0.9:
+                break
+            try:
+                os.remove(path)
+                total-=size
+                CACHE_EVICTIONS.labels(self.name).inc()
+            except FileNotFoundError:
+                pass
+        self._size=total
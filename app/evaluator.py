@@ -1,22 +1,131 @@
-import requests
+import asyncio
+import random
 import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+import httpx
+import outbox
+from http_client import request
+from log import get_logger
+from metrics import timed
+from config import OUTBOX_DEADLINE, OUTBOX_BACKOFF_BASE, OUTBOX_BACKOFF_MAX, OUTBOX_PER_URL, OUTBOX_POLL_INTERVAL
 
-def notify_evaluator(url, payload):
-    max_retry=10
-    delay=1
-    headers = {"Content-Type": "application/json"}
+log=get_logger(__name__)
 
-    for attempt in range(max_retry):
+# Errors that another attempt cannot fix
+PERMANENT_ERRORS=(ValueError, httpx.InvalidURL, httpx.UnsupportedProtocol)
+
+
+def check_url(url):
+    """Raises ValueError unless url is an absolute http(s) URL."""
+    try:
+        parts=urlsplit(url)
+        parts.port
+    except ValueError as e:
+        raise ValueError(f"Invalid evaluation URL {url!r}: {e}") from e
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"Invalid evaluation URL {url!r}")
+
+
+async def notify_evaluator(url, payload, deadline=OUTBOX_DEADLINE):
+    """
+    Queues a notification in the outbox and returns its id straight away;
+    the dispatcher delivers it in the background.
+    """
+    check_url(url)
+    item_id=await asyncio.to_thread(outbox.enqueue, url, payload, deadline)
+    log.info("Queued evaluator notification", extra={"notification": item_id, "url": url})
+    dispatcher.wake()
+    return item_id
+
+
+class Dispatcher:
+    """
+    Delivers outbox rows as they fall due. Failed attempts are retried with
+    full-jitter exponential backoff until the row's deadline, at most
+    OUTBOX_PER_URL requests are in flight per evaluation URL, and anything
+    still pending from a previous run is picked up on start. Rows are
+    claimed before they are sent, so processes sharing the outbox never
+    deliver the same notification twice.
+    """
+
+    def __init__(self, per_url=OUTBOX_PER_URL, poll_interval=OUTBOX_POLL_INTERVAL):
+        self.per_url=per_url
+        self.poll_interval=poll_interval
+        self._task=None
+        self._event=None
+        self._in_flight={}
+        self._url_limits=defaultdict(lambda: asyncio.Semaphore(self.per_url))
+
+    async def start(self):
+        self._event=asyncio.Event()
+        await asyncio.to_thread(outbox.prune)
+        self._task=asyncio.create_task(self._run())
+        log.info("Started evaluator outbox dispatcher")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        pending=[t for t in [self._task, *self._in_flight.values()] if t]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._task=None
+        self._in_flight={}
+        self._url_limits.clear()
+
+    def wake(self):
+        if self._event is not None:
+            self._event.set()
+
+    async def _run(self):
+        while True:
+            try:
+                for item in await asyncio.to_thread(outbox.claim, exclude=set(self._in_flight)):
+                    self._in_flight[item["id"]]=asyncio.create_task(self._deliver(item))
+                next_at=await asyncio.to_thread(outbox.next_due)
+            except Exception as e:
+                log.exception("Evaluator outbox failed: %s", e)
+                next_at=None
+            wait=self.poll_interval if next_at is None else min(max(next_at-time.time(), 0.05), self.poll_interval)
+            self._event.clear()
+            try:
+                await asyncio.wait_for(self._event.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, item):
+        item_id=item["id"]
+        attempts=item["attempts"]+1
         try:
-            r = requests.post(url, json=payload, headers=headers)
-            print(f"Response status: {r.status_code}",flush=True)
-            r.raise_for_status()
-            return r
-        except requests.exceptions.RequestException as e:
-            print("Inside the retry request block",flush=True)
-            if attempt < max_retry - 1:
-                    time.sleep(delay)
-                    delay *= 2
-
-            else:   
-                raise RuntimeError(f"Failed to notify evaluator after {max_retry} attempts. Last error: {e}")
\ No newline at end of file
+            try:
+                async with self._url_limits[item["url"]]:
+                    with timed("notify"):
+                        r=await request("POST", item["url"], upstream="evaluator", json=item["payload"], headers={"Content-Type": "application/json"})
+                        log.info("Evaluator notified", extra={"notification": item_id, "status": r.status_code})
+                        r.raise_for_status()
+            except Exception as e:
+                await self._record_failure(item, attempts, e)
+            else:
+                await asyncio.to_thread(outbox.mark_delivered, item_id)
+        except Exception as e:
+            log.exception("Could not record evaluator notification attempt: %s", e, extra={"notification": item_id})
+        finally:
+            self._in_flight.pop(item_id, None)
+            self.wake()
+
+    async def _record_failure(self, item, attempts, e):
+        error=f"{type(e).__name__}: {e}"
+        if isinstance(e, PERMANENT_ERRORS):
+            log.error("Evaluator notification cannot be delivered: %s", error, extra={"notification": item["id"], "attempts": attempts})
+            await asyncio.to_thread(outbox.mark_failed, item["id"], attempts, error)
+            return
+        backoff=random.uniform(0, min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE*2**attempts))
+        if time.time()+backoff>item["deadline"]:
+            log.error("Giving up on evaluator notification: %s", error, extra={"notification": item["id"], "attempts": attempts})
+            await asyncio.to_thread(outbox.mark_failed, item["id"], attempts, error)
+        else:
+            await asyncio.to_thread(outbox.mark_retry, item["id"], attempts, time.time()+backoff, error)
+
+
+dispatcher=Dispatcher()
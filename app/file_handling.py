@@ -1,92 +1,536 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
+import math
+from dataclasses import dataclass, field, asdict
 from pydantic import BaseModel
 import base64
 import mimetypes
 import os
 import json
-import pandas as pd
 import sqlite3
-import cv2
+import signal
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from config import ATTACHMENT_PROFILE_MODE, ATTACHMENT_SAMPLE_ROWS, ATTACHMENT_WORKERS, ATTACHMENT_TIMEOUT, CACHE_DIR, PROFILE_CACHE_MAX_BYTES, OCR_BACKEND
+from disk_cache import DiskCache, file_sha256, make_key
+from images import image_size
+import ocr
+from log import get_logger
+from metrics import timed
+
+log = get_logger(__name__)
 
 class Attachment(BaseModel):
     name: str
     url: str
 
 
+@dataclass
+class TableProfile:
+    """Compact summary of a tabular attachment: size, schema and a few sample rows."""
+    kind: str
+    rows: Optional[int]
+    columns: List[str]
+    dtypes: Dict[str, str]
+    sample: List[dict] = field(default_factory=list)
+
+    def describe(self):
+        return {
+            "type": "DataFrame",
+            "shape": (self.rows, len(self.columns)),
+            "columns": self.columns,
+            "dtypes": self.dtypes,
+            "sample": self.sample
+        }
+
+
+@dataclass
+class DatabaseProfile:
+    tables: Dict[str, TableProfile]
+
+    def describe(self):
+        return {
+            "type": "SQLite",
+            "tables": {name: table.describe() for name, table in self.tables.items()}
+        }
+
+
+@dataclass
+class ImageProfile:
+    """Image size plus its OCR text, small enough to send back from a worker process."""
+    width: int
+    height: int
+    ocr_text: str = ""
+    ocr_engine: str = "tesseract"
+    error: Optional[str] = None
+
+    def describe(self):
+        if self.error:
+            return {"type": "Image", "size": (self.width, self.height), "error": self.error}
+        return {
+            "type": "Image",
+            "size": (self.width, self.height),
+            "ocr_text_sample": self.ocr_text if len(self.ocr_text) <= 200 else self.ocr_text[:200] + "...",
+            "info": f"OCR processed with {self.ocr_engine.capitalize()}"
+        }
+
+
+def profile_image(file_path):
+    # Dimensions are those of the original; OCR runs on the downscaled grayscale variant
+    width, height = image_size(file_path)
+    try:
+        text, engine = ocr.read_file(file_path)
+        return ImageProfile(width=width, height=height, ocr_text=text, ocr_engine=engine)
+    except Exception as e:
+        return ImageProfile(width=width, height=height, ocr_engine=OCR_BACKEND, error=f"OCR failed: {e}")
+
+
+def _records(df):
+    # Round-trip through JSON so timestamps, NaN and numpy scalars become plain values
+    return json.loads(df.to_json(orient="records", date_format="iso"))
+
 
+def table_profile(kind, df, rows):
+    return TableProfile(
+        kind=kind,
+        rows=rows,
+        columns=[str(c) for c in df.columns],
+        dtypes={str(c): str(t) for c, t in df.dtypes.items()},
+        sample=_records(df)
+    )
 
-def process_attachments(file_paths):
+
+def _count_csv_rows(file_path):
+    # Streams the file counting newlines; quoted multi-line fields make this an estimate
+    lines = 0
+    last = b"\n"
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    if last != b"\n":
+        lines += 1
+    return max(lines - 1, 0)
+
+
+def profile_csv(file_path, sample_rows):
+    import pandas as pd
+    df = pd.read_csv(file_path, nrows=sample_rows)
+    return table_profile("csv", df, _count_csv_rows(file_path))
+
+
+def profile_excel(file_path, sample_rows):
+    import pandas as pd
+    df = pd.read_excel(file_path, nrows=sample_rows)
+    rows = None
+    if file_path.lower().endswith("xlsx"):
+        from openpyxl import load_workbook
+        wb = load_workbook(file_path, read_only=True)
+        sheet = wb.worksheets[0]
+        # max_row comes from the <dimension> element, which some writers omit
+        if sheet.max_row is None:
+            rows = max(sum(1 for _ in sheet.iter_rows(values_only=True)) - 1, 0)
+        else:
+            rows = max(sheet.max_row - 1, 0)
+        wb.close()
+    return table_profile("excel", df, rows)
+
+
+def profile_parquet(file_path, sample_rows):
+    # Row count and schema come from the footer; only the first row group is read
+    import pyarrow.parquet as pq
+    pf = pq.ParquetFile(file_path)
+    if pf.metadata.num_row_groups:
+        df = pf.read_row_group(0).slice(0, sample_rows).to_pandas()
+    else:
+        df = pf.schema_arrow.empty_table().to_pandas()
+    return table_profile("parquet", df, pf.metadata.num_rows)
+
+
+def profile_sqlite(file_path, sample_rows):
+    import pandas as pd
+    conn = sqlite3.connect(f"file:{file_path}?mode=ro", uri=True)
+    try:
+        tables = {}
+        names = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        for table_name in names:
+            quoted = '"' + table_name.replace('"', '""') + '"'
+            rows = conn.execute(f"SELECT COUNT(*) FROM {quoted}").fetchone()[0]
+            df = pd.read_sql_query(f"SELECT * FROM {quoted} LIMIT {int(sample_rows)}", conn)
+            tables[table_name] = table_profile("sqlite", df, rows)
+        return DatabaseProfile(tables=tables)
+    finally:
+        conn.close()
+
+
+def load_attachment(file_name, file_path, mode=ATTACHMENT_PROFILE_MODE, sample_rows=ATTACHMENT_SAMPLE_ROWS):
     """
-    Returns:
-    - files_text: filename -> text content (for text files)
-    - summary: descriptive string about files for LLM prompt
-    - files_binary: filename -> bytes content (for images)
+    Loads a single attachment according to its extension. Returns None for
+    unknown types. pandas and cv2 are imported only by the branches that
+    need them, so JSON, text and Markdown attachments never load them.
     """
+    file_ext = file_name.split('.')[-1].lower()
 
+    if mode == "sample" and file_ext == 'csv':
+        data = profile_csv(file_path, sample_rows)
+        log.debug("Profiled CSV", extra={"file": file_name, "rows": data.rows})
+        return data
 
+    elif mode == "sample" and file_ext in ['xls', 'xlsx']:
+        data = profile_excel(file_path, sample_rows)
+        log.debug("Profiled Excel", extra={"file": file_name})
+        return data
+
+    elif mode == "sample" and file_ext == 'parquet':
+        data = profile_parquet(file_path, sample_rows)
+        log.debug("Profiled Parquet", extra={"file": file_name, "rows": data.rows})
+        return data
+
+    elif mode == "sample" and file_ext in ['db', 'sqlite']:
+        data = profile_sqlite(file_path, sample_rows)
+        log.debug("Profiled SQLite DB", extra={"file": file_name})
+        return data
+
+    elif file_ext == 'csv':
+        import pandas as pd
+        data = pd.read_csv(file_path)
+        log.debug("Loaded CSV", extra={"file": file_name, "rows": len(data)})
+        return data
+
+    elif file_ext == 'json':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        log.debug("Loaded JSON", extra={"file": file_name})
+        return data
+
+    elif file_ext == 'txt':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = f.read()
+        log.debug("Loaded TXT", extra={"file": file_name})
+        return data
+
+    elif file_ext == 'md':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = f.read()
+        log.debug("Loaded MD", extra={"file": file_name})
+        return data
+
+    elif file_ext in ['xls', 'xlsx']:
+        import pandas as pd
+        data = pd.read_excel(file_path)
+        log.debug("Loaded Excel", extra={"file": file_name, "rows": len(data)})
+        return data
+
+    elif file_ext == 'parquet':
+        import pandas as pd
+        data = pd.read_parquet(file_path)
+        log.debug("Loaded Parquet", extra={"file": file_name})
+        return data
+
+    elif file_ext == 'db' or file_ext == 'sqlite':
+        import pandas as pd
+        conn = sqlite3.connect(file_path)
+        tables = pd.read_sql_query("SELECT name FROM sqlite_master WHERE type='table'", conn)
+        data = {}
+        for table_name in tables['name']:
+            data[table_name] = pd.read_sql_query(f"SELECT * FROM '{table_name}'", conn)
+        conn.close()
+        log.debug("Loaded SQLite DB", extra={"file": file_name})
+        return data
+
+    elif mode == "sample" and file_ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
+        data = profile_image(file_path)
+        log.debug("Profiled Image", extra={"file": file_name})
+        return data
+
+    elif file_ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
+        import cv2
+        data = cv2.imread(file_path)
+        log.debug("Loaded Image", extra={"file": file_name})
+        return data
+
+    elif file_ext == 'pdf':
+        # For PDF processing, we'll generate code to extract text
+        log.debug("Marked PDF for processing", extra={"file": file_name})
+        return file_path  # Store path for later processing
+
+    return None
+
+
+class AttachmentTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise AttachmentTimeout(f"Gave up after {ATTACHMENT_TIMEOUT}s")
+
+
+@contextmanager
+def _time_limit(seconds):
+    """Interrupts the worker's own task after seconds, so a stuck file frees its process."""
+    if not hasattr(signal, "SIGALRM") or seconds <= 0 or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def is_dataframe(data):
+    # Checked by name so results that are not tables never import pandas
+    return type(data).__name__ == "DataFrame" and hasattr(data, "dtypes")
+
+
+def _load_compact(file_name, file_path, mode, sample_rows):
+    """
+    Worker-process entry point. Returns only compact results so nothing
+    large is pickled back: DataFrames become TableProfiles and images are
+    OCR'd here and returned as ImageProfiles.
+    """
+    with _time_limit(ATTACHMENT_TIMEOUT):
+        file_ext = file_name.split('.')[-1].lower()
+        if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
+            return profile_image(file_path)
+        data = load_attachment(file_name, file_path, mode, sample_rows)
+        if is_dataframe(data):
+            return table_profile(file_ext, data.head(sample_rows), len(data))
+        if isinstance(data, dict) and data and all(is_dataframe(v) for v in data.values()):
+            return DatabaseProfile(tables={
+                name: table_profile("sqlite", df.head(sample_rows), len(df)) for name, df in data.items()
+            })
+        return data
+
+
+_pool=None
+_pool_lock=threading.Lock()
+# Files submitted to the pool and not finished yet, across all jobs
+_queued=0
+# Slack on top of the per-file limits for worker start-up and pickling results back
+_WAIT_MARGIN=10.0
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the parent runs threads (event loop, to_thread), which fork does not mix well with
+            _pool=ProcessPoolExecutor(max_workers=ATTACHMENT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _retire_pool(pool):
+    """
+    Stops handing new work to a pool that has a worker stuck past the
+    deadline or that is broken because a worker died (e.g. OOM-killed).
+    Later jobs get a fresh pool; work already submitted by other jobs still
+    runs to completion, and the stuck worker is freed by its own time
+    limit, after which the old pool's processes exit.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool=None
+    pool.shutdown(wait=False)
+
+
+def _finished(future):
+    global _queued
+    with _pool_lock:
+        _queued-=1
+
+
+def _wait_bound(files_ahead, files):
+    """
+    How long a job waits for its files. Each file is limited by the worker
+    once it starts, so the wait covers the files queued ahead of it (from
+    any job) and its own, ATTACHMENT_WORKERS at a time.
+    """
+    return math.ceil((files_ahead + files) / ATTACHMENT_WORKERS) * ATTACHMENT_TIMEOUT + _WAIT_MARGIN
+
+
+def _submit(files, mode, sample_rows):
+    """
+    Submits every file to the shared pool and returns (pool, futures, wait
+    bound). A pool that broke since its last use (or was retired by another
+    job meanwhile) is replaced once; returns (None, None, None) when that
+    fails too.
+    """
+    global _queued
+    for _ in range(2):
+        pool=_get_pool()
+        with _pool_lock:
+            files_ahead=_queued
+        futures={}
+        try:
+            for name, path in files.items():
+                futures[name]=pool.submit(_load_compact, name, path, mode, sample_rows)
+                with _pool_lock:
+                    _queued+=1
+                futures[name].add_done_callback(_finished)
+            return pool, futures, _wait_bound(files_ahead, len(files))
+        except RuntimeError as e:
+            # BrokenProcessPool, or "cannot schedule new futures after shutdown"
+            log.warning("Attachment pool unusable, replacing it: %s", e)
+            _retire_pool(pool)
+    return None, None, None
+
+
+def _process_sequential(files, mode, sample_rows):
+    processed_data={}
+    for name, path in files.items():
+        try:
+            data=_load_compact(name, path, mode, sample_rows)
+            if data is not None:
+                processed_data[name]=data
+        except Exception as e:
+            log.warning("Error processing attachment: %s", e, extra={"file": name})
+            processed_data[name]=None
+    return processed_data
+
+
+def _process_parallel(files, mode, sample_rows):
+    pool, futures, timeout=_submit(files, mode, sample_rows)
+    if futures is None:
+        return _process_sequential(files, mode, sample_rows)
+    # Backstop only: a file that overruns normally fails with AttachmentTimeout from its worker
+    _, not_done=wait(futures.values(), timeout=timeout)
     processed_data={}
+    broken=False
+    for name, future in futures.items():
+        if future in not_done:
+            future.cancel()
+            log.warning("Timed out waiting for attachment after %.0fs", timeout, extra={"file": name})
+            processed_data[name]=None
+            continue
+        try:
+            data=future.result()
+            if data is not None:
+                processed_data[name]=data
+        except BrokenProcessPool:
+            # A worker died mid-job; not retried, the file may be what killed it
+            log.warning("Attachment worker died", extra={"file": name})
+            processed_data[name]=None
+            broken=True
+        except Exception as e:
+            log.warning("Error processing attachment: %s", e, extra={"file": name})
+            processed_data[name]=None
+    if broken or any(future.running() for future in not_done):
+        _retire_pool(pool)
+    return processed_data
 
+
+# Bump when the shape of cached profiles changes
+PROFILE_VERSION=1
+_profile_cache=None
+
+
+def get_profile_cache():
+    global _profile_cache
+    if _profile_cache is None:
+        _profile_cache=DiskCache(os.path.join(CACHE_DIR, "profiles"), PROFILE_CACHE_MAX_BYTES, name="profiles")
+    return _profile_cache
+
+
+def _encode_profile(data):
+    """Serialises a cacheable result, or returns None for results that are cheap or unsafe to cache."""
+    if isinstance(data, TableProfile):
+        return {"kind": "table", "value": asdict(data)}
+    if isinstance(data, DatabaseProfile):
+        return {"kind": "database", "value": {name: asdict(t) for name, t in data.tables.items()}}
+    if isinstance(data, ImageProfile) and not data.error:
+        return {"kind": "image", "value": asdict(data)}
+    return None
+
+
+def _decode_profile(entry):
+    if entry["kind"] == "table":
+        return TableProfile(**entry["value"])
+    if entry["kind"] == "database":
+        return DatabaseProfile(tables={name: TableProfile(**t) for name, t in entry["value"].items()})
+    return ImageProfile(**entry["value"])
+
+
+def _profile_key(file_name, file_path, mode, sample_rows, compact):
+    file_ext = file_name.split('.')[-1].lower()
+    return make_key("profile", PROFILE_VERSION, file_sha256(file_path), file_ext, mode, sample_rows, compact, OCR_BACKEND)
+
+
+def process_attachments(file_paths, mode=ATTACHMENT_PROFILE_MODE, sample_rows=ATTACHMENT_SAMPLE_ROWS, parallel=None):
+    """
+    Loads every attachment into something the prompt builder can describe.
+    In "sample" mode tabular files and databases are only profiled
+    (TableProfile / DatabaseProfile: row count, schema and sample_rows rows),
+    so large datasets are never read in full. "full" mode returns whole
+    DataFrames as before.
+
+    With parallel (the default when there are several files and
+    ATTACHMENT_WORKERS > 1) files are spread over a process pool, each
+    bounded by ATTACHMENT_TIMEOUT, and results come back in compact form
+    (profiles instead of DataFrames, OCR'd ImageProfiles instead of arrays).
+
+    Profiles (including OCR text) are cached on disk by the SHA-256 of the
+    file and the processing parameters, so a repeated attachment only costs
+    a hash and a lookup.
+
+    Returns:
+    - filename -> DataFrame / TableProfile / DatabaseProfile / ImageProfile /
+      parsed JSON / text / image array / PDF path, or None when the file
+      could not be read
+    """
+
+    files={}
     for name,file_path in file_paths.items():
-            if not os.path.exists(file_path):
-                print(f"File not found: {file_path}")
-                continue
-                
-            file_name = name
-            file_ext = file_name.split('.')[-1].lower()
-
-            print('file_name :',file_name)
-            print('file_ext :',file_ext)
-            
-            try:
-                if file_ext == 'csv':
-                    processed_data[file_name] = pd.read_csv(file_path)
-                    print(f"Loaded CSV: {file_name} with {len(processed_data[file_name])} rows")
-                    
-                elif file_ext == 'json':
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        processed_data[file_name] = json.load(f)
-                    print(f"Loaded JSON: {file_name}")
-                    
-                elif file_ext == 'txt':
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        processed_data[file_name] = f.read()
-                    print(f"Loaded TXT: {file_name}")
-
-                elif file_ext == 'md':
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        processed_data[file_name] = f.read()
-                    print(f"Loaded MD: {file_name}")
-
-                elif file_ext in ['xls', 'xlsx']:
-                    processed_data[file_name] = pd.read_excel(file_path)
-                    print(f"Loaded Excel: {file_name} with {len(processed_data[file_name])} rows")
-                    
-                elif file_ext == 'parquet':
-                    processed_data[file_name] = pd.read_parquet(file_path)
-                    print(f"Loaded Parquet: {file_name}")
-                    
-                elif file_ext == 'db' or file_ext == 'sqlite':
-                    conn = sqlite3.connect(file_path)
-                    tables = pd.read_sql_query("SELECT name FROM sqlite_master WHERE type='table'", conn)
-                    processed_data[file_name] = {}
-                    for table_name in tables['name']:
-                        processed_data[file_name][table_name] = pd.read_sql_query(f"SELECT * FROM '{table_name}'", conn)
-                    conn.close()
-                    print(f"Loaded SQLite DB: {file_name}")
-                    
-                elif file_ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
-                    processed_data[file_name] = cv2.imread(file_path)
-                    print(f"Loaded Image: {file_name}")
-                    
-                elif file_ext == 'pdf':
-                    # For PDF processing, we'll generate code to extract text
-                    processed_data[file_name] = file_path  # Store path for later processing
-                    print(f"Marked PDF for processing: {file_name}")
-                    
-            except Exception as e:
-                print(f"Error processing {file_name}: {e}")
-                processed_data[file_name] = None
-
-    print('processed_data :',processed_data)
+        if not os.path.exists(file_path):
+            log.warning("Attachment not found", extra={"path": file_path})
+            continue
+        files[name]=file_path
+
+    if parallel is None:
+        parallel = ATTACHMENT_WORKERS > 1 and len(files) > 1
+    compact = parallel or mode == "sample"
+
+    cache=get_profile_cache()
+    cached={}
+    keys={}
+    for file_name,file_path in list(files.items()):
+        keys[file_name]=_profile_key(file_name, file_path, mode, sample_rows, compact)
+        entry=cache.get_json(keys[file_name])
+        if entry is not None:
+            cached[file_name]=_decode_profile(entry)
+            del files[file_name]
+    log.info("Profile cache lookup", extra={"hits": len(cached), "misses": len(files)})
+
+    with timed("profile"):
+        if parallel and len(files) > 1:
+            processed_data=_process_parallel(files, mode, sample_rows)
+        else:
+            processed_data={}
+            for file_name,file_path in files.items():
+                try:
+                    data = load_attachment(file_name, file_path, mode, sample_rows)
+                    if data is not None:
+                        processed_data[file_name] = data
+                except Exception as e:
+                    log.warning("Error processing attachment: %s", e, extra={"file": file_name})
+                    processed_data[file_name] = None
+
+    for file_name,data in processed_data.items():
+        entry=_encode_profile(data)
+        if entry is not None:
+            cache.set_json(keys[file_name], entry)
+    processed_data.update(cached)
+    # Keep the caller's order so prompts stay deterministic
+    processed_data={name: processed_data[name] for name in file_paths if name in processed_data}
+
+    log.debug("Processed attachments: %s", processed_data)
                 
-    return processed_data
\ No newline at end of file
+    return processed_data
@@ -1,9 +1,15 @@
 import subprocess
 import os
-import requests
-from config import GITHUB_TOKEN, GITHUB_API
+import asyncio
+import base64
+from config import GITHUB_TOKEN, GITHUB_API, PUBLISH_BACKEND, PUBLISH_BRANCH
+from http_client import request
+from log import get_logger
+from metrics import timed
 import tempfile
 
+log = get_logger(__name__)
+
 def run_shell(cmd, cwd=None):
     result = subprocess.run(cmd, shell=True, capture_output=True, text=True, cwd=cwd)
     if result.returncode != 0:
@@ -11,33 +17,157 @@ def run_shell(cmd, cwd=None):
     return result.stdout.strip()
 
 
-def create_repo(repo_name, private=False):
-    print("Starting the repo creation process")
+async def create_repo(repo_name, private=False):
+    log.info("Creating the repo", extra={"repo": repo_name})
     url = f"{GITHUB_API}/user/repos"
     headers = {
         "Authorization": f"Bearer {GITHUB_TOKEN}",
         "Accept": "application/vnd.github+json"
     }
     data = {"name": repo_name, "private": private }
-    r = requests.post(url, headers=headers, json=data)
-    print("Sent request to git for repo creation")
-    r.raise_for_status()
-    return r.json()
+    if PUBLISH_BACKEND == "api":
+        # The Git Data API refuses to work on an empty repository, so start it with an initial commit
+        data["auto_init"] = True
+    r = await request("POST", url, upstream="github", headers=headers, json=data)
+    if r.status_code == 422 and "already exists" in r.text:
+        # Left behind by an earlier attempt at this task that failed after the repo stage
+        log.info("Repo already exists, reusing it", extra={"repo": repo_name})
+        user = await _github("GET", "/user")
+        repo = await get_repo(user["login"], repo_name)
+    else:
+        r.raise_for_status()
+        repo = r.json()
+    if PUBLISH_BACKEND == "api":
+        await ensure_publish_branch(repo)
+    return repo
 
-def enable_github_pages(repo_full_name):
-    print("Starting git pages enabling")
+async def ensure_publish_branch(repo):
+    """
+    auto_init commits to the account's default branch; when PUBLISH_BRANCH
+    is another one, creates it from that commit so the API push and Pages
+    have it to work on. The git backend creates it on its first push.
+    """
+    if repo.get("default_branch") == PUBLISH_BRANCH:
+        return
+    r = await request("GET", f"{GITHUB_API}/repos/{repo['full_name']}/git/ref/heads/{PUBLISH_BRANCH}", upstream="github", headers=_api_headers())
+    if r.status_code == 200:
+        return
+    if r.status_code != 404:
+        r.raise_for_status()
+    head = await _github("GET", f"/repos/{repo['full_name']}/git/ref/heads/{repo['default_branch']}")
+    log.info("Creating the publish branch", extra={"repo": repo["full_name"], "branch": PUBLISH_BRANCH})
+    await _github("POST", f"/repos/{repo['full_name']}/git/refs", json={"ref": f"refs/heads/{PUBLISH_BRANCH}", "sha": head["object"]["sha"]})
+
+async def enable_github_pages(repo_full_name):
+    log.info("Enabling GitHub Pages", extra={"repo": repo_full_name})
     url = f"{GITHUB_API}/repos/{repo_full_name}/pages"
     headers = {
         "Authorization": f"token {GITHUB_TOKEN}",
         "Accept": "application/vnd.github.switcheroo-preview+json"
     }
-    data = {"source": {"branch": "main", "path": "/"}}
-    r = requests.post(url, headers=headers, json=data)
+    data = {"source": {"branch": PUBLISH_BRANCH, "path": "/"}}
+    with timed("pages"):
+        r = await request("POST", url, upstream="github", headers=headers, json=data)
+        if r.status_code == 409:
+            # Already enabled by an earlier attempt on a reused repo
+            log.info("GitHub Pages already enabled", extra={"repo": repo_full_name})
+            return r.json()
+        r.raise_for_status()
+    return r.json()
+
+async def get_repo(owner, repo_name):
+    url = f"{GITHUB_API}/repos/{owner}/{repo_name}"
+    headers = {}
+    if GITHUB_TOKEN:
+        headers['Authorization'] = f'token {GITHUB_TOKEN}'
+    r = await request("GET", url, upstream="github", headers=headers)
+    if r.status_code == 404:
+        raise RuntimeError("Repository not found.")
+    if r.status_code != 200:
+        raise RuntimeError(f"Error: {r.status_code} - {r.text}")
+    return r.json()
+
+def _api_headers():
+    return {
+        "Authorization": f"Bearer {GITHUB_TOKEN}",
+        "Accept": "application/vnd.github+json"
+    }
+
+async def _github(method, path, **kwargs):
+    r = await request(method, f"{GITHUB_API}{path}", upstream="github", headers=_api_headers(), **kwargs)
     r.raise_for_status()
     return r.json()
 
-def push_code(clone_url, local_dir):
-    print("Starting the code push",flush=True)
+def repo_full_name(clone_url):
+    # https://github.com/owner/name.git -> owner/name
+    parts = clone_url.rstrip("/").split("/")
+    return f"{parts[-2]}/{parts[-1].removesuffix('.git')}"
+
+def _collect_files(local_dir):
+    files = []
+    for root, dirs, names in os.walk(local_dir):
+        dirs[:] = [d for d in dirs if d != ".git"]
+        for name in names:
+            path = os.path.join(root, name)
+            files.append((os.path.relpath(path, local_dir).replace(os.sep, "/"), path))
+    return files
+
+async def _create_blob(full_name, path):
+    with open(path, "rb") as f:
+        content = base64.b64encode(f.read()).decode("ascii")
+    blob = await _github("POST", f"/repos/{full_name}/git/blobs", json={"content": content, "encoding": "base64"})
+    return blob["sha"]
+
+async def push_code_via_api(full_name, local_dir, message="init"):
+    """
+    Publishes the contents of local_dir on top of the branch head using the
+    Git Data API: one blob per file, a tree layered on the current tree, a
+    commit and a ref update. No clone or working tree is needed.
+    Returns the full SHA of the new commit.
+    """
+    log.info("Pushing through the Git Data API", extra={"repo": full_name})
+    parent_sha = await get_branch_head(full_name)
+    parent = await _github("GET", f"/repos/{full_name}/git/commits/{parent_sha}")
+
+    files = _collect_files(local_dir)
+    blob_shas = await asyncio.gather(*(_create_blob(full_name, path) for _, path in files))
+    tree_entries = [
+        {"path": rel_path, "mode": "100644", "type": "blob", "sha": sha}
+        for (rel_path, _), sha in zip(files, blob_shas)
+    ]
+    tree = await _github("POST", f"/repos/{full_name}/git/trees", json={"base_tree": parent["tree"]["sha"], "tree": tree_entries})
+    commit = await _github("POST", f"/repos/{full_name}/git/commits", json={
+        "message": message,
+        "tree": tree["sha"],
+        "parents": [parent_sha],
+        "author": {"name": "bot", "email": "bot@example.com"}
+    })
+    await _github("PATCH", f"/repos/{full_name}/git/refs/heads/{PUBLISH_BRANCH}", json={"sha": commit["sha"]})
+    log.info("Pushed files", extra={"repo": full_name, "files": len(files), "commit": commit["sha"]})
+    return commit["sha"]
+
+async def get_branch_head(full_name):
+    ref = await _github("GET", f"/repos/{full_name}/git/ref/heads/{PUBLISH_BRANCH}")
+    return ref["object"]["sha"]
+
+def shallow_clone(clone_url, dest):
+    """Fetches only the tip of the publish branch into dest and returns its commit SHA."""
+    secure_clone_url = clone_url.replace("https://", f"https://{GITHUB_TOKEN}@") if GITHUB_TOKEN else clone_url
+    with timed("clone"):
+        run_shell(f"git clone --depth 1 --single-branch --branch {PUBLISH_BRANCH} {secure_clone_url} {dest}")
+        return run_shell("git rev-parse HEAD", cwd=dest)
+
+async def push_code(clone_url, local_dir):
+    with timed("push"):
+        if PUBLISH_BACKEND == "api":
+            try:
+                return await push_code_via_api(repo_full_name(clone_url), local_dir)
+            except Exception as e:
+                log.warning("Git Data API push failed, falling back to git: %s", e)
+        return await asyncio.to_thread(push_code_with_git, clone_url, local_dir)
+
+def push_code_with_git(clone_url, local_dir):
+    log.info("Pushing with git", extra={"repo": clone_url})
 
     with tempfile.TemporaryDirectory() as temp_dir:
         clone_path = os.path.join(temp_dir, "repo")
@@ -46,6 +176,11 @@ def push_code(clone_url, local_dir):
 
         # Clone into unique subdirectory
         run_shell(f"git clone {secure_clone_url} {clone_path}")
+        # Work on the publish branch, starting it from what was cloned if it does not exist yet
+        if run_shell(f"git ls-remote --heads origin {PUBLISH_BRANCH}", cwd=clone_path):
+            run_shell(f"git checkout -B {PUBLISH_BRANCH} origin/{PUBLISH_BRANCH}", cwd=clone_path)
+        else:
+            run_shell(f"git checkout -B {PUBLISH_BRANCH}", cwd=clone_path)
 
         # Copy generated code into clone directory
         run_shell(f"cp -r {local_dir}/* {clone_path}/")
@@ -54,15 +189,9 @@ def push_code(clone_url, local_dir):
         run_shell("git config user.name 'bot'", cwd=clone_path)
         run_shell("git config user.email 'bot@example.com'", cwd=clone_path)
         run_shell("git add .", cwd=clone_path)
-        commit_output = run_shell("git commit -m 'init'", cwd=clone_path)
-
-        import re
-        match = re.search(r"\[.+ ([a-f0-9]{7,40})\]", commit_output)
-        commit_sha = match.group(1) if match else "unknown"
-        
-        run_shell("git push", cwd=clone_path)
-
-        # return run_shell("git rev-parse HEAD", cwd="repo_temp")
+        run_shell("git commit -m 'init'", cwd=clone_path)
+        commit_sha = run_shell("git rev-parse HEAD", cwd=clone_path)
         
+        run_shell(f"git push origin {PUBLISH_BRANCH}", cwd=clone_path)
         
     return commit_sha
\ No newline at end of file
@@ -0,0 +1,196 @@
+import re
+from dataclasses import dataclass
+from config import LLM_STREAM_ABORT_CHARS
+
+SEARCHING="searching"
+IN_HTML="in_html"
+DONE="done"
+NOT_HTML="not_html"
+
+_START_RE=re.compile(r"```html[ \t]*\r?\n?|<!DOCTYPE|<html\b", re.IGNORECASE)
+_END_HTML_RE=re.compile(r"</html\s*>", re.IGNORECASE)
+# Longest marker we must be able to see across a chunk boundary
+_HOLDBACK=len("</html >")
+
+
+_VALID_START_RE=re.compile(r"\s*(<!DOCTYPE|<html\b)", re.IGNORECASE)
+_DOC_START_RE=re.compile(r"<!DOCTYPE|<html\b", re.IGNORECASE)
+_FENCE_LANG_RE=re.compile(r"[A-Za-z0-9_+-]*")
+
+
+def _utf8_len(text):
+    # str.isascii() only checks a flag, so ASCII responses are never encoded
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+def _doc_end(text, start, stop):
+    """
+    End of the last </html> tag in text[start:stop], or stop when there is
+    none. The tag is normally near the end, so the search runs backwards
+    over growing windows instead of scanning (or copying) the whole text.
+    """
+    window=4096
+    while True:
+        lo=max(start, stop-window)
+        last=None
+        for last in _END_HTML_RE.finditer(text, lo, stop):
+            pass
+        if last:
+            return last.end()
+        if lo==start:
+            return stop
+        window*=4
+
+
+def _find_fence(text, pos):
+    # Single-character find runs at memchr speed, far faster than
+    # text.find("```") on long text, and lone backticks are rare
+    while True:
+        idx=text.find("`", pos)
+        if idx<0 or text.startswith("```", idx):
+            return idx
+        pos=idx+1
+
+
+class NotHtmlError(Exception):
+    pass
+
+
+@dataclass
+class ExtractResult:
+    html: str
+    method: str  # "raw", "fence", "doctype" or "none"
+    trimmed_bytes: int
+
+
+def extract_html(response):
+    """
+    Extracts the HTML document from a raw LLM response. The response is
+    never copied or lower-cased: fences are found with a memchr-speed find and tags
+    with precompiled case-insensitive patterns bounded to the span being
+    looked at. Preference order:
+      1. the response already is a document ("raw"), cut after its last </html>
+      2. the largest ```html fenced block that holds a document ("fence")
+      3. from the first <!DOCTYPE / <html to the last </html> ("doctype")
+    Returns an ExtractResult; html is empty and method "none" when nothing
+    looks like HTML.
+    """
+    text=response.strip()
+
+    def result(start, stop, method):
+        html=text[start:stop].strip()
+        return ExtractResult(html=html, method=method, trimmed_bytes=_utf8_len(response)-_utf8_len(html))
+
+    if _VALID_START_RE.match(text):
+        return result(0, _doc_end(text, 0, len(text)), "raw")
+
+    best=None
+    pos=0
+    while True:
+        open_at=_find_fence(text, pos)
+        if open_at<0:
+            break
+        lang=_FENCE_LANG_RE.match(text, open_at+3)
+        close_at=_find_fence(text, lang.end())
+        body_end=close_at if close_at>=0 else len(text)  # an unterminated block runs to the end
+        if lang.group(0).lower()=="html":
+            start=_VALID_START_RE.match(text, lang.end(), body_end)
+            if start:
+                span=(start.start(1), _doc_end(text, start.start(1), body_end))
+                if best is None or span[1]-span[0]>best[1]-best[0]:
+                    best=span
+        if close_at<0:
+            break
+        pos=close_at+3
+    if best:
+        return result(best[0], best[1], "fence")
+
+    start=_DOC_START_RE.search(text)
+    if start:
+        return result(start.start(), _doc_end(text, start.start(), len(text)), "doctype")
+
+    return result(0, 0, "none")
+
+
+class IncrementalHtmlExtractor:
+    """
+    Pulls the HTML document out of a streamed LLM response chunk by chunk.
+    It looks for a ```html fence, <!DOCTYPE or <html, then passes the
+    document through to sink (any object with write()) until </html> or the
+    closing fence. Text after the document is never waited for: feed()
+    returns False as soon as the document is complete, so the caller can
+    stop reading the stream. If no document has started within abort_after
+    characters the response is declared not HTML.
+    """
+
+    def __init__(self, sink=None, abort_after=LLM_STREAM_ABORT_CHARS):
+        self.sink=sink
+        self.abort_after=abort_after
+        self.state=SEARCHING
+        self.fenced=False
+        self._buffer=""
+        self._parts=[]
+        self._seen=0
+
+    def feed(self, text):
+        if self.state in (DONE, NOT_HTML):
+            return False
+        self._seen+=len(text)
+        self._buffer+=text
+        if self.state==SEARCHING:
+            match=_START_RE.search(self._buffer)
+            if not match:
+                if self._seen>self.abort_after:
+                    self.state=NOT_HTML
+                    return False
+                # Keep only a tail long enough to hold a split start marker
+                self._buffer=self._buffer[-16:]
+                return True
+            self.fenced=match.group(0).startswith("```")
+            self._buffer=self._buffer[match.end():] if self.fenced else self._buffer[match.start():]
+            self.state=IN_HTML
+        return self._scan()
+
+    def _scan(self):
+        end=_END_HTML_RE.search(self._buffer)
+        fence=self._buffer.find("```") if self.fenced else -1
+        if end and (fence<0 or end.end()<=fence):
+            self._emit(self._buffer[:end.end()])
+            self._finish()
+            return False
+        if fence>=0:
+            self._emit(self._buffer[:fence])
+            self._finish()
+            return False
+        # Everything except a short tail is safe to write out
+        safe=max(len(self._buffer)-_HOLDBACK, 0)
+        self._emit(self._buffer[:safe])
+        self._buffer=self._buffer[safe:]
+        return True
+
+    def _emit(self, text):
+        if not self._parts:
+            text=text.lstrip()
+        if text:
+            self._parts.append(text)
+            if self.sink is not None:
+                self.sink.write(text)
+
+    def _finish(self):
+        self._buffer=""
+        self.state=DONE
+
+    def close(self):
+        """Call when the stream ends. Returns the extracted document."""
+        if self.state==IN_HTML:
+            # Stream ended without </html>; keep what we have
+            self._emit(self._buffer)
+            self._finish()
+        if self.state!=DONE:
+            self.state=NOT_HTML
+            raise NotHtmlError("The LLM response does not contain an HTML document")
+        return self.html
+
+    @property
+    def html(self):
+        return "".join(self._parts).strip()
@@ -0,0 +1,72 @@
+import asyncio
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+import httpx
+import rate_limit
+from config import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_MAX_PER_HOST, HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT
+
+_client=None
+_host_limits={}
+
+
+def get_client():
+    """
+    Returns the process-wide async client. Connections are pooled and kept
+    alive, so repeated calls to the LLM proxy, GitHub and the evaluator reuse
+    their TLS sessions instead of handshaking on every request.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client=httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+def _host_limit(url):
+    host=urlsplit(url).netloc
+    if host not in _host_limits:
+        _host_limits[host]=asyncio.Semaphore(HTTP_MAX_PER_HOST)
+    return _host_limits[host]
+
+
+async def request(method, url, upstream=None, **kwargs):
+    """
+    Sends a request through the shared client, capped at HTTP_MAX_PER_HOST in
+    flight per host. With upstream ("llm", "github", "evaluator") the call
+    also waits for that upstream's rate limiter, and the response headers are
+    fed back to it.
+    """
+    if upstream is None:
+        async with _host_limit(url):
+            return await get_client().request(method, url, **kwargs)
+    limiter = rate_limit.get_upstream(upstream)
+    async with limiter.slot(), _host_limit(url):
+        response = await get_client().request(method, url, **kwargs)
+    limiter.observe(response)
+    return response
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client=None
+    _host_limits.clear()
+    rate_limit.reset()
+
+
+@asynccontextmanager
+async def stream(method, url, upstream=None, **kwargs):
+    """Streaming variant of request(); the response body is read inside the with block."""
+    if upstream is None:
+        async with _host_limit(url):
+            async with get_client().stream(method, url, **kwargs) as response:
+                yield response
+        return
+    limiter = rate_limit.get_upstream(upstream)
+    async with limiter.slot(), _host_limit(url):
+        async with get_client().stream(method, url, **kwargs) as response:
+            limiter.observe(response)
+            yield response
@@ -0,0 +1,144 @@
+import base64
+import os
+from config import (
+    CACHE_DIR, IMAGE_CACHE_MAX_BYTES, IMAGE_LLM_MAX_EDGE, IMAGE_LLM_QUALITY,
+    IMAGE_OCR_DPI, IMAGE_OCR_SOURCE_DPI, IMAGE_OCR_MAX_EDGE,
+)
+from attachments import image_data_uri
+from disk_cache import DiskCache, file_sha256, make_key
+from log import get_logger
+from metrics import timed
+
+# Derived copies of image attachments; the decoded original is what gets
+# published and is never modified. Variants are cached by the SHA-256 of the
+# original plus the settings that shaped them:
+# - llm: longest edge capped at IMAGE_LLM_MAX_EDGE, re-encoded as JPEG
+#   (PNG when the image has transparency), original kept if that is smaller
+# - ocr: grayscale, rescaled from the source DPI to IMAGE_OCR_DPI and capped
+#   at IMAGE_OCR_MAX_EDGE, stored as PNG
+
+log = get_logger(__name__)
+
+# Bump when the way variants are produced changes
+IMAGE_VERSION = 1
+
+_cache = None
+
+
+def get_image_cache():
+    global _cache
+    if _cache is None:
+        _cache = DiskCache(os.path.join(CACHE_DIR, "images"), IMAGE_CACHE_MAX_BYTES, name="images")
+    return _cache
+
+
+def image_size(path):
+    """(width, height) from the file header when Pillow is available, otherwise by decoding it."""
+    try:
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.size
+    except ImportError:
+        import cv2
+        img = cv2.imread(path)
+        if img is None:
+            raise ValueError("Unreadable image")
+        return img.shape[1], img.shape[0]
+
+
+def _source_dpi(path):
+    try:
+        from PIL import Image
+        with Image.open(path) as img:
+            dpi = img.info.get("dpi")
+        if dpi and float(dpi[0]) > 1:
+            return float(dpi[0])
+    except Exception:
+        pass
+    return IMAGE_OCR_SOURCE_DPI or None
+
+
+def _resize(img, scale):
+    import cv2
+    if abs(scale - 1) < 0.01:
+        return img
+    height, width = img.shape[:2]
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+
+
+def _mime_of(data):
+    return "image/png" if data.startswith(b"\x89PNG") else "image/jpeg"
+
+
+def llm_variant(path, sha256=None, mime=None):
+    """Returns (bytes, mime) of the copy of the image sent to the LLM."""
+    if mime == "image/gif":
+        # May be animated; re-encoding would keep only the first frame
+        with open(path, "rb") as f:
+            return f.read(), mime
+    key = make_key("llm", IMAGE_VERSION, sha256 or file_sha256(path), IMAGE_LLM_MAX_EDGE, IMAGE_LLM_QUALITY)
+    cache = get_image_cache()
+    data = cache.get(key)
+    if data is not None:
+        return data, _mime_of(data)
+
+    import cv2
+    with timed("image_llm"):
+        img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if img is None:
+            raise ValueError("Unreadable image")
+        height, width = img.shape[:2]
+        resized = _resize(img, min(1.0, IMAGE_LLM_MAX_EDGE / max(height, width)))
+        has_alpha = img.ndim == 3 and img.shape[2] == 4 and bool((img[:, :, 3] < 255).any())
+        if has_alpha:
+            ok, buf = cv2.imencode(".png", resized, [cv2.IMWRITE_PNG_COMPRESSION, 6])
+        else:
+            if resized.ndim == 3 and resized.shape[2] == 4:
+                resized = cv2.cvtColor(resized, cv2.COLOR_BGRA2BGR)
+            ok, buf = cv2.imencode(".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, IMAGE_LLM_QUALITY])
+        if not ok:
+            raise ValueError("Could not encode image")
+        data = buf.tobytes()
+        original_size = os.path.getsize(path)
+        if resized is img and original_size <= len(data):
+            with open(path, "rb") as f:
+                data = f.read()
+    log.debug("Prepared LLM image", extra={"path": path, "bytes_before": original_size, "bytes_after": len(data)})
+    cache.set(key, data)
+    return data, _mime_of(data)
+
+
+def llm_data_uri(attachment):
+    """Data URI of the LLM variant of a StoredAttachment, or of the original if it cannot be processed."""
+    try:
+        data, mime = llm_variant(attachment.path, attachment.sha256, attachment.mime)
+    except Exception as e:
+        log.warning("Sending the original image: %s", e, extra={"attachment": attachment.name})
+        return image_data_uri(attachment)
+    return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def ocr_variant(path, sha256=None):
+    """Returns the grayscale image (numpy array) to run OCR on."""
+    import cv2
+    import numpy as np
+    key = make_key("ocr", IMAGE_VERSION, sha256 or file_sha256(path), IMAGE_OCR_DPI, IMAGE_OCR_SOURCE_DPI, IMAGE_OCR_MAX_EDGE)
+    cache = get_image_cache()
+    data = cache.get(key)
+    if data is not None:
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+
+    with timed("image_ocr"):
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError("Unreadable image")
+        height, width = gray.shape[:2]
+        dpi = _source_dpi(path)
+        scale = IMAGE_OCR_DPI / dpi if dpi else 1.0
+        scale = min(scale, IMAGE_OCR_MAX_EDGE / max(height, width))
+        gray = _resize(gray, scale)
+        ok, buf = cv2.imencode(".png", gray)
+    if ok:
+        cache.set(key, buf.tobytes())
+    return gray
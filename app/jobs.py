@@ -0,0 +1,132 @@
+import asyncio
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+from log import get_logger
+from metrics import JOBS_FINISHED
+
+log=get_logger(__name__)
+
+QUEUED="queued"
+RUNNING="running"
+SUCCEEDED="succeeded"
+FAILED="failed"
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, key, payload):
+        self.key=key
+        self.payload=payload
+        self.state=QUEUED
+        self.error=None
+        self.result=None
+        self.submitted_at=time.time()
+        self.started_at=None
+        self.finished_at=None
+        self.duplicates=0
+
+    def to_dict(self):
+        return {
+            "key": self.key,
+            "state": self.state,
+            "duplicates": self.duplicates,
+            "error": self.error,
+            "result": self.result,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    Bounded in-process job queue drained by a fixed number of workers.
+    Jobs are admitted only while the queue has room, so a burst of requests
+    gets rejected up front instead of piling onto the shared threadpool.
+    A coroutine handler is awaited on the event loop; a blocking handler runs
+    on a dedicated executor sized to the worker count.
+    """
+
+    def __init__(self, handler, workers=2, max_queued=20, keep_finished=1000):
+        self.handler=handler
+        self.workers=workers
+        self.max_queued=max_queued
+        self.keep_finished=keep_finished
+        self.jobs={}
+        self._queue=None
+        self._tasks=[]
+        self._executor=None
+
+    async def start(self):
+        self._queue=asyncio.Queue(maxsize=self.max_queued)
+        self._executor=ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._tasks=[asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        log.info("Started job workers", extra={"workers": self.workers, "queue_size": self.max_queued})
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks=[]
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, key, payload):
+        if self._queue is None:
+            raise RuntimeError("Job queue has not been started")
+        existing=self.jobs.get(key)
+        if existing and existing.state in (QUEUED, RUNNING):
+            # A retried submission attaches to the job already in flight
+            existing.duplicates+=1
+            return existing
+        job=Job(key, payload)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(f"Job queue is full ({self.max_queued} waiting)")
+        self.jobs[key]=job
+        self._trim()
+        return job
+
+    def get(self, key):
+        return self.jobs.get(key)
+
+    def depth(self):
+        return self._queue.qsize() if self._queue else 0
+
+    def running(self):
+        return sum(1 for job in self.jobs.values() if job.state==RUNNING)
+
+    async def _worker(self):
+        loop=asyncio.get_running_loop()
+        while True:
+            job=await self._queue.get()
+            job.state=RUNNING
+            job.started_at=time.time()
+            try:
+                if inspect.iscoroutinefunction(self.handler):
+                    job.result=await self.handler(job.payload)
+                else:
+                    job.result=await loop.run_in_executor(self._executor, self.handler, job.payload)
+                job.state=SUCCEEDED
+            except Exception as e:
+                job.state=FAILED
+                job.error=str(e)
+                # Pipeline failures carry the stage timings gathered so far
+                if getattr(e, "timings", None):
+                    job.result={"stages": e.timings}
+                log.error("Job failed: %s", e, extra={"job": job.key})
+            finally:
+                job.finished_at=time.time()
+                JOBS_FINISHED.labels(job.state).inc()
+                self._queue.task_done()
+
+    def _trim(self):
+        # Forget the oldest finished jobs so the status table doesn't grow forever
+        finished=[k for k, j in self.jobs.items() if j.state in (SUCCEEDED, FAILED)]
+        for key in finished[:max(0, len(finished)-self.keep_finished)]:
+            del self.jobs[key]
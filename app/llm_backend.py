@@ -0,0 +1,216 @@
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from config import (
+    LLM_API_URL, LLM_TIMEOUT, LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX,
+    LLM_HEDGE, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_SAMPLES,
+)
+from http_client import request, stream
+from html_extract import IncrementalHtmlExtractor
+from log import get_logger
+from metrics import observe_llm
+
+load_dotenv()
+
+log = get_logger(__name__)
+
+api_key = os.getenv("OPENAI_API_KEY")
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class LLMUnavailable(Exception):
+    """Every target failed; the caller should fall back."""
+
+
+class RetryableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class Target:
+    model: str
+    url: str = LLM_API_URL
+
+
+def parse_targets(spec):
+    """'gpt-5-mini,gpt-5-nano@https://other/v1/chat/completions' -> [Target, ...]"""
+    targets = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        model, _, url = item.partition("@")
+        targets.append(Target(model=model, url=url or LLM_API_URL))
+    return targets
+
+
+class LatencyTracker:
+    """Keeps the last few latencies per target to derive the hedging delay."""
+
+    def __init__(self, size=100):
+        self.size = size
+        self.samples = {}
+
+    def record(self, target, seconds):
+        self.samples.setdefault(target, deque(maxlen=self.size)).append(seconds)
+
+    def percentile(self, target, q):
+        samples = sorted(self.samples.get(target, ()))
+        if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+latency = LatencyTracker()
+
+
+def _headers():
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _check(response, target):
+    if response.status_code == 200:
+        return
+    message = f"{target.model}: HTTP {response.status_code} {response.text[:200]}"
+    if response.status_code in RETRYABLE_STATUS:
+        raise RetryableError(message, _retry_after(response))
+    raise RuntimeError(message)
+
+
+async def _call(target, messages, stream_to=None):
+    data = {"model": target.model, "messages": messages}
+    start = time.monotonic()
+    usage = None
+    try:
+        if stream_to:
+            content = await _call_streaming(target, data, stream_to)
+        else:
+            response = await request("POST", target.url, upstream="llm", headers=_headers(), json=data, timeout=LLM_TIMEOUT)
+            _check(response, target)
+            body = response.json()
+            usage = body.get("usage")
+            content = body.get('choices',[{}])[0].get('message',{}).get('content',"")
+        if not content:
+            raise RetryableError(f"{target.model}: empty response")
+    except asyncio.CancelledError:
+        observe_llm(target.model, time.monotonic() - start, "cancelled")
+        raise
+    except Exception:
+        observe_llm(target.model, time.monotonic() - start, "error")
+        raise
+    elapsed = time.monotonic() - start
+    latency.record(target, elapsed)
+    observe_llm(target.model, elapsed, "ok", usage)
+    return content
+
+
+async def _call_streaming(target, data, output_path):
+    """
+    Streams the completion and extracts the HTML document while the SSE
+    chunks arrive, writing it to output_path as it goes. Reading stops at
+    </html>, and the request is abandoned early if the output is not HTML.
+    """
+    with open(output_path, "w", encoding="utf-8") as sink:
+        extractor = IncrementalHtmlExtractor(sink)
+        async with stream("POST", target.url, upstream="llm", headers=_headers(), json=dict(data, stream=True), timeout=LLM_TIMEOUT) as response:
+            if response.status_code != 200:
+                await response.aread()
+                _check(response, target)
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                choices = json.loads(payload).get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta and not extractor.feed(delta):
+                    break
+        return extractor.close()
+
+
+async def _with_retries(target, messages, stream_to=None):
+    """Calls one target, retrying 429/5xx/transport errors with full-jitter exponential backoff."""
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            return await _call(target, messages, stream_to)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            retryable = isinstance(e, RetryableError) or e.__class__.__module__.startswith("httpx")
+            if not retryable or attempt == LLM_MAX_RETRIES:
+                raise
+            delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+            if isinstance(e, RetryableError) and e.retry_after is not None:
+                delay = max(delay, min(e.retry_after, LLM_BACKOFF_MAX))
+            log.warning("LLM call failed (%s), retrying in %.1fs", e, delay, extra={"model": target.model})
+            await asyncio.sleep(delay)
+
+
+async def _hedged(primary, backup, messages):
+    """
+    Runs primary; if it is still in flight after its recent latency
+    percentile, also runs backup and returns (content, target) of whichever
+    succeeds first.
+    """
+    delay = latency.percentile(primary, LLM_HEDGE_PERCENTILE)
+    first = asyncio.create_task(_with_retries(primary, messages))
+    if delay is None:
+        return await first, primary
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result(), primary
+    log.info("Slower than p%d (%.1fs), hedging", int(LLM_HEDGE_PERCENTILE*100), delay, extra={"model": primary.model, "backup": backup.model})
+    second = asyncio.create_task(_with_retries(backup, messages))
+    targets = {first: primary, second: backup}
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), targets[task]
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def complete(targets, messages, stream_to=None):
+    """
+    Sends messages to the first target that answers, trying them in order.
+    stream_to switches to a streamed request whose HTML is written to that
+    path (streamed requests are never hedged, both would write the file).
+    Returns (content, target). Raises LLMUnavailable when every target fails.
+    """
+    errors = []
+    for i, target in enumerate(targets):
+        backup = targets[i + 1] if i + 1 < len(targets) else target
+        try:
+            if LLM_HEDGE and not stream_to:
+                return await _hedged(target, backup, messages)
+            return await _with_retries(target, messages, stream_to), target
+        except Exception as e:
+            log.warning("LLM target failed: %s", e, extra={"model": target.model})
+            errors.append(f"{target.model}: {e}")
+    raise LLMUnavailable("; ".join(errors) or "no LLM targets configured")
@@ -0,0 +1,59 @@
+import json
+import logging
+import sys
+from config import LOG_LEVEL, LOG_FORMAT
+
+# Every module logs through get_logger(__name__). Fields passed with
+# extra={...} are appended as key=value pairs (or JSON keys with
+# LOG_FORMAT=json). Raw dumps of prompts and generated pages are logged at
+# DEBUG with lazy %-formatting, so they cost nothing at the default level.
+
+_STANDARD=set(vars(logging.makeLogRecord({})))|{"message", "asctime"}
+_configured=False
+
+
+def _fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _STANDARD}
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line=super().format(record)
+        fields=_fields(record)
+        if fields:
+            line+=" "+" ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry={
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry["exc"]=self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def _configure():
+    global _configured
+    root=logging.getLogger("app")
+    handler=logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT=="json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(logging.CRITICAL+1 if LOG_LEVEL=="OFF" else getattr(logging, LOG_LEVEL, logging.INFO))
+    root.propagate=False
+    _configured=True
+
+
+def get_logger(name):
+    if not _configured:
+        _configure()
+    return logging.getLogger(f"app.{name}")
@@ -1,27 +1,35 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+import startup
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from config import SERVER_SECRET
-from github_utils import create_repo, enable_github_pages, push_code
+from config import SERVER_SECRET, JOB_WORKERS, JOB_QUEUE_SIZE, PUBLISH_BACKEND, WARMUP_MODULES
+from jobs import JobQueue, QueueFull, SUCCEEDED
+from github_utils import create_repo, enable_github_pages, push_code, get_repo, get_branch_head, shallow_clone, repo_full_name
 from llm_generator import generate_app_code,revise_app_code
 from file_handling import process_attachments
-from evaluator import notify_evaluator
+from evaluator import notify_evaluator, dispatcher, check_url
+from http_client import close_client
 from mit_license import generate_mit_license
 from readme import generate_readme
-import tempfile
+import snapshot_cache
+from task_store import get_task, save_task, get_request, save_request
+from attachments import ingest_attachments, copy_attachments
+from workspace import Workspace
+from html_extract import extract_html
+from pipeline import Pipeline, StageFailed
+from log import get_logger
+import metrics
+import asyncio
 import os
 from dotenv import load_dotenv
-import base64
-import re 
-import sys 
-from bs4 import BeautifulSoup
-import requests
 import shutil
 
 app=FastAPI()
 
 load_dotenv()
 
+log=get_logger(__name__)
+
 class AppRequest(BaseModel):
     email: str
     secret: str
@@ -32,450 +40,384 @@ class AppRequest(BaseModel):
     evaluation_url: str
     checks: list = []
     attachments: list = []
+    bypass_cache: bool = False
 
 SERVER_SECRET=os.getenv("SERVER_SECRET")
 GITHUB_TOKEN=os.getenv("GITHUB_TOKEN")
 
+@app.on_event("startup")
+async def start_job_queue():
+    await dispatcher.start()
+    await job_queue.start()
+    startup.mark_ready()
+    report = startup.report(top=5)
+    log.info("Ready to accept requests after %.2fs", report["ready_seconds"], extra={"slowest_imports": report["imports"]})
+    modules = [m.strip() for m in WARMUP_MODULES.split(",") if m.strip()]
+    if modules:
+        # Loads the heavy libraries while the first requests are already being accepted
+        app.state.warmup = asyncio.create_task(asyncio.to_thread(startup.warm_up, modules))
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    await job_queue.stop()
+    await dispatcher.stop()
+    await close_client()
+
 @app.post("/api-endpoint")
-async def api_handler(req:AppRequest,background_tasks:BackgroundTasks):
-    print(SERVER_SECRET)
+async def api_handler(req:AppRequest):
     if req.secret != SERVER_SECRET:
         raise HTTPException(status_code=403, detail="Invalid secret")
+    try:
+        check_url(req.evaluation_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    key=request_key(req)
+    job=job_queue.get(key)
+    if job is None or job.state!=SUCCEEDED:
+        done=await asyncio.to_thread(get_request, req.email, req.task, req.round, req.nonce)
+    else:
+        done=job.result
+    if done:
+        # Already published: answer from the stored result and notify again, nothing is recomputed
+        log.info("Replaying completed job", extra={"nonce": req.nonce, "task": req.task})
+        await notify_evaluator(req.evaluation_url, evaluation_payload(req, done["repo_url"], done["commit_sha"], done["pages_url"]))
+        return JSONResponse(content={"status":"completed","nonce":req.nonce,"commit_sha":done["commit_sha"],"pages_url":done["pages_url"]},status_code=200)
 
-    print("Successfully validated the server secret")
-
-    print("Started background task")
-    background_tasks.add_task(process_request, req)
-
-    print("Returned the immediate 200 Ok response")
-    return JSONResponse(content={"status":"received"},status_code=200)
-
-repo_store = {}
-
-def process_request(req:AppRequest):
-    print("process_request has been invoked") 
+    try:
+        job=job_queue.submit(key, req)
+    except QueueFull as e:
+        log.warning("Rejected job: %s", e, extra={"nonce": req.nonce, "task": req.task})
+        return JSONResponse(content={"status":"busy","detail":str(e)},status_code=503,headers={"Retry-After":"30"})
+
+    if job.duplicates:
+        log.info("Duplicate of in-flight job", extra={"nonce": req.nonce, "state": job.state})
+        return JSONResponse(content={"status":job.state,"nonce":req.nonce},status_code=200)
+
+    log.info("Queued job", extra={"nonce": req.nonce, "task": req.task, "round": req.round, "queue_depth": job_queue.depth()})
+    return JSONResponse(content={"status":"received","nonce":req.nonce},status_code=200)
+
+@app.get("/jobs/{nonce}")
+async def job_status(nonce:str):
+    jobs=[j for j in job_queue.jobs.values() if j.payload.nonce==nonce]
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return jobs[-1].to_dict()
+
+@app.get("/startup")
+async def startup_report():
+    return startup.report()
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+def request_key(req):
+    """Idempotency key: a retried post of the same round carries the same nonce."""
+    return f"{req.email}:{req.task}:{req.round}:{req.nonce}"
+
+async def load_repo_snapshot(task, repo_url, workspace):
+    """
+    Returns (commit_sha, path) of a local copy of the published tree. The
+    snapshot cache is used when it holds the current branch head, otherwise
+    the head is fetched with a shallow clone and cached for next time.
+    """
+    try:
+        head_sha = await get_branch_head(repo_full_name(repo_url))
+    except Exception as e:
+        log.warning("Could not read branch head, fetching the repo: %s", e)
+        head_sha = None
+    cached_sha, path = snapshot_cache.lookup(task)
+    if head_sha and cached_sha == head_sha:
+        log.info("Using cached snapshot", extra={"task": task, "commit": head_sha})
+        return head_sha, path
+
+    log.info("Snapshot cache is stale, fetching the repo", extra={"task": task})
+    clone_dir = os.path.join(workspace.scratch_dir, "clone")
+    head_sha = await asyncio.to_thread(shallow_clone, repo_url, clone_dir)
+    path = await asyncio.to_thread(snapshot_cache.store, task, head_sha, clone_dir)
+    shutil.rmtree(clone_dir, ignore_errors=True)
+    return head_sha, path
+
+async def save_repo_snapshot(task, commit_sha, publish_dir, base_dir=None):
+    # The code is already published at this point, a cache failure must not fail the job
+    try:
+        await asyncio.to_thread(snapshot_cache.store, task, commit_sha, publish_dir, base_dir)
+    except Exception as e:
+        log.warning("Could not cache snapshot: %s", e, extra={"task": task})
+
+def extract_page(response):
+    result = extract_html(response)
+    if not result.html:
+        raise ValueError("No HTML document found in the LLM response")
+    log.info("Extracted index.html", extra={"method": result.method, "trimmed_bytes": result.trimmed_bytes})
+    return result.html
+
+def evaluation_payload(req, repo_url, commit_sha, pages_url):
+    return {
+        "email": req.email,
+        "task": req.task,
+        "round": req.round,
+        "nonce": req.nonce,
+        "repo_url": repo_url,
+        "commit_sha": commit_sha,
+        "pages_url": pages_url
+    }
+
+def read_repo_files(repo_dir):
+    """Returns (prettified <head>, first brief, {path: file}) for the published tree at repo_dir."""
+    from bs4 import BeautifulSoup
+    pretty_html = None
+    first_brief = None
+    file_paths = {}
+    for root, _, files in os.walk(repo_dir):
+        if '.git' in root.split(os.sep):
+            continue
+        for file in files:
+            filepath = os.path.join(root, file)
+            rel_path = os.path.relpath(filepath, repo_dir)
+            if file == "index.html":
+                with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
+                    html_content = f.read().strip()
+                    soup = BeautifulSoup(html_content, "html.parser")
+
+                    # Prettify it (adds indentation and newlines)
+                    pretty_html = soup.head.prettify() if soup.head else html_content
+            elif file == "brief.txt":
+                with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
+                    first_brief=f.read().strip()
+            elif rel_path not in ['LICENSE', 'README.md']:
+                # Read straight from the snapshot, no need to copy
+                file_paths[rel_path]=filepath
+    return pretty_html, first_brief, file_paths
+
+def round1_pipeline(req, workspace):
+    """
+    create_repo only needs the task name, so it runs while the model is
+    generating; README/LICENSE and attachment staging run alongside too.
+    """
+    temp_dir = workspace.publish_dir
+    index_path = os.path.join(temp_dir, "index.html")
+
+    def ingest():
+        if not req.attachments:
+            return []
+        #save the files, decoding each data URI only once
+        stored_attachments = ingest_attachments(req.attachments, workspace.attachments_dir, workspace.reserve)
+        log.debug("Saved files")
+        return stored_attachments
+
+    async def generate(ingest):
+        image_data = [a for a in ingest if a.is_image]
+        file_paths = {a.name: a.path for a in ingest} or None
+        log.info("Sending the brief to the LLM", extra={"attachments": len(ingest)})
+        files = await generate_app_code(req.brief,file_paths,bool(image_data),image_data,use_cache=not req.bypass_cache,output_path=index_path)
+        log.info("Received the response from the llm")
+        return files
+
+    def write_page(generate):
+        cleaned_code=extract_page(generate)
+        os.makedirs(temp_dir, exist_ok=True)
+        with open(index_path, "w",encoding="utf-8") as f:
+            f.write(cleaned_code)
+
+    def write_static(ingest):
+        log.debug("Writing attachments to temp dir")
+        copy_attachments(ingest, temp_dir)
+        with open(os.path.join(temp_dir, "brief.txt"), "w") as f:
+            f.write(req.brief)
+        log.debug("Writing the README.md and LICENSE for the generated app")
+        readme=generate_readme(brief=req.brief,round=req.round,task=req.task)
+        with open(os.path.join(temp_dir, "README.md"), "w") as f:
+            f.write(readme)
+        license_text=generate_mit_license(author_name=req.email.split('@')[0])
+        with open(os.path.join(temp_dir, "LICENSE"), "w") as f:
+            f.write(license_text)
+
+    async def repo():
+        log.debug("Creating the repo")
+        created = await create_repo(req.task)
+        log.info("Repo created")
+        return created
+
+    async def push(repo, write_page, write_static):
+        log.debug("Pushing the generated code to the repo")
+        commit_sha = await push_code(repo["clone_url"], temp_dir)
+        log.info("Successfully pushed the code")
+        return commit_sha
+
+    async def snapshot(push):
+        await save_repo_snapshot(req.task, push, temp_dir)
+
+    async def pages(repo, **_):
+        log.debug("Enabling git pages")
+        await enable_github_pages(repo["full_name"])
+        log.info("Successfully enabled git pages")
+
+    async def record(repo, push, pages):
+        # Save repo info for round 2, shared by every worker process
+        pages_url = f"https://{repo['owner']['login']}.github.io/{repo['name']}/"
+        await asyncio.to_thread(save_task, req.email, req.task,
+            repo_url=repo["clone_url"],
+            html_url=repo["html_url"],
+            pages_url=pages_url,
+            full_name=repo["full_name"],
+            commit_sha=push,
+            brief=req.brief
+        )
+        return {"commit_sha": push, "pages_url": pages_url}
+
+    async def notify(repo, record):
+        payload = evaluation_payload(req, repo["html_url"], record["commit_sha"], record["pages_url"])
+        await asyncio.to_thread(save_request, req.email, req.task, req.round, req.nonce,
+            repo["html_url"], record["commit_sha"], record["pages_url"])
+        log.info("Sending evaluation request", extra={"url": req.evaluation_url, "commit": record["commit_sha"]})
+        log.debug("Evaluation payload: %s", payload)
+        await notify_evaluator(req.evaluation_url, payload)
+        return dict(record, repo_url=repo["html_url"])
+
+    pipeline = Pipeline("round1", req.task)
+    pipeline.add("ingest", ingest)
+    pipeline.add("generate", generate, deps=["ingest"])
+    pipeline.add("write_page", write_page, deps=["generate"])
+    pipeline.add("write_static", write_static, deps=["ingest"])
+    pipeline.add("repo", repo)
+    pipeline.add("push", push, deps=["repo", "write_page", "write_static"])
+    pipeline.add("snapshot", snapshot, deps=["push"])
+    # With the API backend the repo starts with a commit on the publish branch, so Pages can be enabled before the push
+    pipeline.add("pages", pages, deps=["repo"] if PUBLISH_BACKEND == "api" else ["repo", "push"])
+    pipeline.add("record", record, deps=["repo", "push", "pages"])
+    pipeline.add("notify", notify, deps=["repo", "record"])
+    return pipeline
+
+def round2_pipeline(req, workspace):
+    """The repo lookup and snapshot load overlap with attachment ingestion."""
+    temp_dir = workspace.publish_dir
+    index_path = os.path.join(temp_dir, "index.html")
+
+    async def lookup():
+        stored = await asyncio.to_thread(get_task, req.email, req.task)
+        if stored:
+            log.info("Found the repo in the task store")
+            return {"repo_url": stored["repo_url"], "html_url": stored["html_url"], "brief": stored["brief"]}
+        log.info("Fetching clone url")
+        owner='23f3001761'
+        data = await get_repo(owner, req.task)
+        await asyncio.to_thread(save_task, req.email, req.task,
+            repo_url=data['clone_url'],
+            html_url=data['html_url'],
+            full_name=data["full_name"]
+        )
+        return {"repo_url": data['clone_url'], "html_url": data['html_url'], "brief": None}
+
+    def ingest():
+        if not req.attachments:
+            return []
+        #save the files, decoding each data URI only once
+        stored_attachments = ingest_attachments(req.attachments, workspace.attachments_dir, workspace.reserve)
+        log.debug("Saved files")
+        return stored_attachments
+
+    async def snapshot(lookup):
+        _, repo_dir = await load_repo_snapshot(req.task, lookup["repo_url"], workspace)
+        return repo_dir
+
+    def read_repo(snapshot):
+        log.debug("Reading current files from repo")
+        return read_repo_files(snapshot)
+
+    async def revise(lookup, ingest, read_repo):
+        pretty_html, first_brief, file_paths = read_repo
+        file_paths = dict(file_paths, **{a.name: a.path for a in ingest})
+        image_data = [a for a in ingest if a.is_image]
+        log.info("Sending brief, attachments and existing code to the LLM")
+        updated_files = await revise_app_code(
+            brief=req.brief,
+            file_paths=file_paths if file_paths else None,
+            html_content=pretty_html,
+            image_present=bool(image_data),
+            image_data=image_data,
+            repo_url=lookup["repo_url"],
+            first_brief=first_brief or lookup["brief"],
+            use_cache=not req.bypass_cache,
+            output_path=index_path
+        )
+        log.info("LLM returned updated files")
+        return updated_files
+
+    def write_page(revise):
+        cleaned_code=extract_page(revise)
+        os.makedirs(temp_dir, exist_ok=True)
+        with open(index_path, "w",encoding="utf-8") as f:
+            f.write(cleaned_code)
+        if "README.md" not in revise:
+            log.info("Updating README.md")
+            readme=generate_readme(brief=req.brief,round=req.round,task=req.task)
+            with open(os.path.join(temp_dir, "README.md"), "w") as f:
+                f.write(readme)
+
+    def write_static(ingest):
+        log.debug("Writing attachments to temp dir")
+        copy_attachments(ingest, temp_dir)
+
+    async def push(lookup, snapshot, write_page, write_static):
+        log.debug("Preparing to push updated code")
+        commit_sha = await push_code(lookup["repo_url"], temp_dir)
+        await save_repo_snapshot(req.task, commit_sha, temp_dir, snapshot)
+        return commit_sha
+
+    async def record(push):
+        await asyncio.to_thread(save_task, req.email, req.task, commit_sha=push)
+
+    async def notify(lookup, push, record):
+        repo_url = lookup["repo_url"]
+        pages_url = f"https://{repo_url.split('/')[-2]}.github.io/{repo_url.split('/')[-1].replace('.git','')}/"
+        payload = evaluation_payload(req, lookup["html_url"], push, pages_url)
+        await asyncio.to_thread(save_request, req.email, req.task, req.round, req.nonce,
+            lookup["html_url"], push, pages_url)
+        log.info("Sending evaluation update", extra={"url": req.evaluation_url, "commit": push})
+        log.debug("Evaluation payload: %s", payload)
+        await notify_evaluator(req.evaluation_url, payload)
+        return {"repo_url": lookup["html_url"], "commit_sha": push, "pages_url": pages_url}
+
+    pipeline = Pipeline("round2", req.task)
+    pipeline.add("lookup", lookup)
+    pipeline.add("ingest", ingest)
+    pipeline.add("snapshot", snapshot, deps=["lookup"])
+    pipeline.add("read_repo", read_repo, deps=["snapshot"])
+    pipeline.add("revise", revise, deps=["lookup", "ingest", "read_repo"])
+    pipeline.add("write_page", write_page, deps=["revise"])
+    pipeline.add("write_static", write_static, deps=["ingest"])
+    pipeline.add("push", push, deps=["lookup", "snapshot", "write_page", "write_static"])
+    pipeline.add("record", record, deps=["push"])
+    pipeline.add("notify", notify, deps=["lookup", "push", "record"])
+    return pipeline
+
+async def process_request(req:AppRequest):
+    log.info("Processing job", extra={"nonce": req.nonce, "task": req.task, "round": req.round})
+    workspace = Workspace(req.nonce)
     try:
         if req.round == 1:
+            pipeline = round1_pipeline(req, workspace)
+            results = await pipeline.run()
+            return dict(results["notify"], stages=pipeline.timings)
 
-            print("Started the llm request",flush=True)
-
-            if req.attachments:
-                image_present=False
-
-                #save the files 
-                upload_dir = "/tmp"
-                file_paths = {}
-                image_data=[]
-
-                for dict in req.attachments:
-                    if dict['url'].startswith("data:image/"):
-                        image_present=True
-                        image_data.append({'url':dict['url']})
-                    filepath = os.path.join(upload_dir, dict['name'])
-                    _, base64_data = dict['url'].split(",", 1)
-                    decoded_bytes = base64.b64decode(base64_data)
-                    with open(filepath, "wb") as f:
-                        f.write(decoded_bytes)
-
-                file_paths[dict['name']]=filepath
-
-                print("Saved files")
-
-                print("file_paths :",file_paths)
-
-                print("Sending brief with attachments",flush=True)
-
-                files = generate_app_code(req.brief,file_paths,image_present,image_data)
-
-                print(files,flush=True)
-                print("Received the response from the llm")
-                # print(req.attachments)
-                #files_text, summary, files_binary = process_attachments(req.attachments)
-            else:
-                print("Sending brief without attachments")
-                files=generate_app_code(req.brief,None,image_present=False,image_data=[])
-                print("Received the response from the llm")
-                
-
-            print("Starting the temp directory",flush=True)
-           
-
-
-
-            def extract_html_from_llm_response(response: str) -> str:
-                """
-                Extracts the HTML code inside markdown ```html fences from an LLM response,
-                removes any explanation text before or after, and returns clean HTML.
-                If no markdown fences found, tries to locate the first <!DOCTYPE and returns from there.
-                Args:
-                    response (str): Raw LLM response string.
-                Returns:
-                    str: Cleaned HTML string starting with <!DOCTYPE.
-                Raises:
-                    ValueError: if no HTML code found.
-                """
-
-                response = response.strip()
-
-                # 0. Early return: Check if response is already valid HTML
-                if re.match(r"^(<!DOCTYPE|<html)", response, re.IGNORECASE):
-                    return response
-
-
-
-                # 1. Try to extract content inside ```html ... ```
-                fence_pattern = re.compile(r"```html\s*(.*?)```", re.DOTALL | re.IGNORECASE)
-                match = fence_pattern.search(response)
-                if match:
-                    html_code = match.group(1).strip()
-                    # Confirm it starts with <!DOCTYPE or <html>
-                    if re.match(r"^(<!DOCTYPE|<html)", html_code, re.IGNORECASE):
-                        return html_code
-
-                # 2. Fallback: find first <!DOCTYPE in entire response and return from there
-                doctype_match = re.search(r"<!DOCTYPE", response, re.IGNORECASE)
-                if doctype_match:
-                    html_code = response[doctype_match.start():].strip()
-                    # Cut off any trailing explanation after closing </html> tag
-                    end_html = re.search(r"</html>", html_code, re.IGNORECASE)
-                    if end_html:
-                        html_code = html_code[:end_html.end()]
-                    return html_code
-
-
-
-            cleaned_code=extract_html_from_llm_response(files)
-            print(cleaned_code,flush=True)
-
-            
-
-            with tempfile.TemporaryDirectory() as temp_dir:
-                file_path=os.path.join(temp_dir, "index.html")
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                with open(file_path, "w",encoding="utf-8") as f:
-                    f.write(cleaned_code)
-
-
-
-                print("Writing attachments to temp dir")
-                if req.attachments:
-                    for file_dict in req.attachments:
-                        name = file_dict["name"]
-                        _, base64_data = file_dict["url"].split(",", 1)
-                        binary_content = base64.b64decode(base64_data)
-
-                        # Save to temp_dir
-                        filepath = os.path.join(temp_dir, name)
-                        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-                        with open(filepath, "wb") as f:
-                            f.write(binary_content)
-
-
-                with open(os.path.join(temp_dir, "brief.txt"), "w") as f:
-                    f.write(req.brief)
-                    
-
-
-                print("Generating readme")
-                readme=generate_readme(brief=req.brief,round=req.round,task=req.task)
-                print("Writing the README.md for the generated app")
-                with open(os.path.join(temp_dir, "README.md"), "w") as f:
-                    f.write(readme)
-
-                license_text=generate_mit_license(author_name=req.email.split('@')[0])
-                print("Writing the license")
-                with open(os.path.join(temp_dir, "LICENSE"), "w") as f:
-                    f.write(license_text)
-
-                print("Creating the repo")
-                repo = create_repo(req.task)
-                print("Repo created")
-                print("Pushing the generated code to the repo",flush=True)
-                commit_sha = push_code(repo["clone_url"], temp_dir)
-                print("Successfully pushed the code",flush=True)
-                print("Enabling git pages",flush=True)
-                enable_github_pages(repo["full_name"])
-                print("Successfully enabled git pages",flush=True)
-
-                global repo_store
-
-                # Save repo info for later (keyed by task)
-                repo_store= {
-                    "repo_url": repo["clone_url"],
-                    "pages_url": f"https://{repo['owner']['login']}.github.io/{repo['name']}/",
-                    "html_url": repo["html_url"]
-                }
-
-
-                print("Sending evaluation request",flush=True)
-
-                print(req.evaluation_url, {
-                    "email": req.email,
-                    "task": req.task,
-                    "round": req.round,
-                    "nonce": req.nonce,
-                    "repo_url": repo["html_url"],
-                    "commit_sha": commit_sha,
-                    "pages_url": f"https://{repo['owner']['login']}.github.io/{repo['name']}/"
-                },flush=True)
-
-                notify_evaluator(req.evaluation_url, {
-                    "email": req.email,
-                    "task": req.task,
-                    "round": req.round,
-                    "nonce": req.nonce,
-                    "repo_url": repo["html_url"],
-                    "commit_sha": commit_sha,
-                    "pages_url": f"https://{repo['owner']['login']}.github.io/{repo['name']}/"
-                })
-                
         if req.round==2:
+            pipeline = round2_pipeline(req, workspace)
+            results = await pipeline.run()
+            return dict(results["notify"], stages=pipeline.timings)
 
-            print("Round 2: Starting revision process",flush=True)
-
-            repo_dir = tempfile.mkdtemp()
-
-            if repo_store:
-
-                print("Cloning the existing repo to get current code")
-                print(repo_store)
-                repo_url =  repo_store["repo_url"]
-                html_url = repo_store["html_url"]
-                
-
-            else:
-                print("Fetching clone url",flush=True)
-                owner='23f3001761'
-                repo_name=req.task
-                url = f"https://api.github.com/repos/{owner}/{repo_name}"
-                headers = {}
-            
-                if GITHUB_TOKEN:
-                    headers['Authorization'] = f'token {GITHUB_TOKEN}'
-            
-                response = requests.get(url, headers=headers)
-            
-                if response.status_code == 200:
-                    data = response.json()
-                    repo_url= data['clone_url']  # This is the GitHub repo URL
-                    html_url=data['html_url']
-                elif response.status_code == 404:
-                    return "Repository not found."
-                else:
-                    return f"Error: {response.status_code} - {response.text}"
-
-
-            upload_dir = "/tmp"
-            file_paths = {}
-            if req.attachments:
-                image_present=False
-                #save the files 
-                image_data=[]
-
-                for dict in req.attachments:
-                    if dict['url'].startswith("data:image/"):
-                        image_present=True
-                        image_data.append({'url':dict['url']})
-                    filepath = os.path.join(upload_dir, dict['name'])
-                    _, base64_data = dict['url'].split(",", 1)
-                    decoded_bytes = base64.b64decode(base64_data)
-                    with open(filepath, "wb") as f:
-                        f.write(decoded_bytes)
-
-                file_paths[dict['name']]=filepath
-
-                print("Saved files",flush=True)
-
-
-            
-
-            os.system(f"git clone {repo_url} {repo_dir}")
-
-            print("Reading current files from repo",flush=True)
-            other_files = []
-            html_content = None
-            for root, _, files in os.walk(repo_dir):
-                if '.git' in root.split(os.sep):
-                    continue 
-                for file in files:
-                    filepath = os.path.join(root, file)
-                    rel_path = os.path.relpath(filepath, repo_dir)
-                    if file == "index.html":
-                        with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-                            html_content = f.read().strip()
-                            soup = BeautifulSoup(html_content, "html.parser")
-
-                            # Prettify it (adds indentation and newlines)
-                            pretty_html = soup.head.prettify()
-                    elif file == "brief.txt":
-                        with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-                            first_brief=f.read().strip()
-                        
-                    else:
-                        if rel_path not in ['LICENSE', 'README.md']:
-                            target_path = os.path.join(upload_dir, rel_path)
-                            with open(filepath, "rb") as source_file:
-                                binary_content = source_file.read()
-                            with open(target_path, "wb") as target_file:
-                                target_file.write(binary_content)
-                            file_paths[rel_path]=target_path
-            
-            
-            
-            print("html_content :",pretty_html)
-            #print("other_files :",other_files)
-
-
-
-
-            if req.attachments:
-
-                print("Sending brief, attachments and existing code to the LLM",flush=True)
-                updated_files = revise_app_code(
-                    brief=req.brief,
-                    file_paths=file_paths if file_paths else None,
-                    html_content=pretty_html,
-                    #other_files=other_files,
-                    image_present=image_present,
-                    image_data=image_data,
-                    repo_url=repo_url,
-                    first_brief=first_brief
-                )
-
-            else:
-                print("Sending brief without attachments and existing code to the LLM",flush=True)
-                updated_files = revise_app_code(
-                    brief=req.brief,
-                    file_paths=file_paths if file_paths else None,
-                    html_content=pretty_html,
-                    #other_files=other_files,
-                    image_present=False,
-                    image_data=[],
-                    repo_url=repo_url,
-                    first_brief=first_brief
-                )
-                
-
-
-                
-            print("LLM returned updated files",flush=True)
-
-
-
-            def extract_html_from_llm_response(response: str) -> str:
-                """
-                Extracts the HTML code inside markdown ```html fences from an LLM response,
-                removes any explanation text before or after, and returns clean HTML.
-                If no markdown fences found, tries to locate the first <!DOCTYPE and returns from there.
-                Args:
-                    response (str): Raw LLM response string.
-                Returns:
-                    str: Cleaned HTML string starting with <!DOCTYPE.
-                Raises:
-                    ValueError: if no HTML code found.
-                """
-
-                response = response.strip()
-
-                # 0. Early return: Check if response is already valid HTML
-                if re.match(r"^(<!DOCTYPE|<html)", response, re.IGNORECASE):
-                    return response
-
-
-                # 1. Try to extract content inside ```html ... ```
-                fence_pattern = re.compile(r"```html\s*(.*?)```", re.DOTALL | re.IGNORECASE)
-                match = fence_pattern.search(response)
-                if match:
-                    html_code = match.group(1).strip()
-                    # Confirm it starts with <!DOCTYPE or <html>
-                    if re.match(r"^(<!DOCTYPE|<html)", html_code, re.IGNORECASE):
-                        return html_code
-
-                # 2. Fallback: find first <!DOCTYPE in entire response and return from there
-                doctype_match = re.search(r"<!DOCTYPE", response, re.IGNORECASE)
-                if doctype_match:
-                    html_code = response[doctype_match.start():].strip()
-                    # Cut off any trailing explanation after closing </html> tag
-                    end_html = re.search(r"</html>", html_code, re.IGNORECASE)
-                    if end_html:
-                        html_code = html_code[:end_html.end()]
-                    return html_code
-                
-                return html_code
-
-            
-    
-            print("updated_files :",updated_files)
-
-            cleaned_code=extract_html_from_llm_response(updated_files)
-            print(cleaned_code)
-
-
-
-
-            with tempfile.TemporaryDirectory() as temp_dir:
-                file_path=os.path.join(temp_dir, "index.html")
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                with open(file_path, "w",encoding="utf-8") as f:
-                    f.write(cleaned_code)   #pretty_html
-
-
-
-
-                print("Writing attachments to temp dir")
-                if req.attachments:
-                    for file_dict in req.attachments:
-                        name = file_dict["name"]
-                        if name in other_files:
-                            continue
-                        _, base64_data = file_dict["url"].split(",", 1)
-                        binary_content = base64.b64decode(base64_data)
-
-                        # Save to temp_dir
-                        filepath = os.path.join(temp_dir, name)
-                        with open(filepath, "wb") as f:
-                            f.write(binary_content)
-
-
-        
-
-                print("Updating README.md",flush=True)
-                readme=generate_readme(brief=req.brief,round=req.round,task=req.task)
-                readme_path = os.path.join(temp_dir, "README.md")
-                if "README.md" not in updated_files:
-                    with open(readme_path, "w") as f:
-                        f.write(readme)
-
-
-
-                print("Preparing to push updated code")
-                commit_sha = push_code(repo_url, temp_dir)
-
-                print("Sending evaluation update")
-                print(req.evaluation_url, {
-                    "email": req.email,
-                    "task": req.task,
-                    "round": req.round,
-                    "nonce": req.nonce,
-                    "repo_url": html_url,
-                    "commit_sha": commit_sha,
-                    "pages_url": f"https://{repo_url.split('/')[-2]}.github.io/{repo_url.split('/')[-1].replace('.git','')}/"
-                },flush=True)
-                notify_evaluator(req.evaluation_url, {
-                    "email": req.email,
-                    "task": req.task,
-                    "round": req.round,
-                    "nonce": req.nonce,
-                    "repo_url": html_url,
-                    "commit_sha": commit_sha,
-                    "pages_url": f"https://{repo_url.split('/')[-2]}.github.io/{repo_url.split('/')[-1].replace('.git','')}/"
-                })
-
-                if os.path.exists(repo_dir):
-                    shutil.rmtree(repo_dir, ignore_errors=True)
-    
+    except StageFailed as e:
+        log.error("Failed processing task: %s", e, exc_info=e.error, extra={"nonce": req.nonce, "task": req.task})
+        raise
     except Exception as e:
         # TODO: You may want to log this or notify a failure endpoint
-        exc_type, exc_obj, tb = sys.exc_info()
-        line_number = tb.tb_lineno
-        print(f"[ERROR] Failed processing task {req.task}: {e} : {line_number}")
\ No newline at end of file
+        log.exception("Failed processing task: %s", e, extra={"nonce": req.nonce, "task": req.task})
+        raise
+    finally:
+        workspace.cleanup()
+
+job_queue=JobQueue(process_request, workers=JOB_WORKERS, max_queued=JOB_QUEUE_SIZE)
+metrics.JOBS_QUEUED.set_function(job_queue.depth)
+metrics.JOBS_RUNNING.set_function(job_queue.running)
@@ -0,0 +1,48 @@
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# Prometheus metrics served on /metrics. Values live in the process that
+# records them: with ATTACHMENT_WORKERS > 0 the OCR inside the profiling
+# pool is covered by the "profile" operation, not "ocr".
+
+_SECONDS=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120, 300)
+
+STAGE_SECONDS=Histogram("app_stage_seconds", "Duration of job pipeline stages", ["pipeline", "stage"], buckets=_SECONDS)
+STAGE_ERRORS=Counter("app_stage_errors_total", "Job pipeline stages that raised", ["pipeline", "stage"])
+OPERATION_SECONDS=Histogram("app_operation_seconds", "Duration of decode, profile, ocr, clone, push, pages and notify operations", ["operation"], buckets=_SECONDS)
+OPERATION_ERRORS=Counter("app_operation_errors_total", "Operations that raised", ["operation"])
+LLM_SECONDS=Histogram("app_llm_request_seconds", "Latency of single LLM requests", ["model", "outcome"], buckets=_SECONDS)
+LLM_TOKENS=Counter("app_llm_tokens_total", "Tokens reported in LLM usage", ["model", "kind"])
+JOBS_QUEUED=Gauge("app_jobs_queued", "Jobs waiting in the queue")
+JOBS_RUNNING=Gauge("app_jobs_running", "Jobs being processed")
+JOBS_FINISHED=Counter("app_jobs_finished_total", "Finished jobs", ["state"])
+CACHE_REQUESTS=Counter("app_cache_requests_total", "On-disk cache lookups", ["cache", "result"])
+CACHE_BYTES=Gauge("app_cache_bytes", "Size of the on-disk cache as tracked by this process", ["cache"])
+CACHE_EVICTIONS=Counter("app_cache_evictions_total", "Entries evicted to stay under the size cap", ["cache"])
+UPSTREAM_IN_FLIGHT=Gauge("app_upstream_in_flight", "Outbound requests in flight per upstream", ["upstream"])
+
+
+@contextmanager
+def timed(operation):
+    """Observes the duration of the block under app_operation_seconds and counts failures."""
+    start=time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        OPERATION_ERRORS.labels(operation).inc()
+        raise
+    finally:
+        OPERATION_SECONDS.labels(operation).observe(time.perf_counter()-start)
+
+
+def observe_llm(model, seconds, outcome, usage=None):
+    LLM_SECONDS.labels(model, outcome).observe(seconds)
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage and usage.get(kind):
+            LLM_TOKENS.labels(model, kind.split("_")[0]).inc(usage[kind])
+
+
+def render():
+    """Returns (body, content type) for the /metrics endpoint."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,111 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from config import OCR_BACKEND, OCR_LANGS, OCR_WORKERS, OCR_TIMEOUT
+from log import get_logger
+from metrics import timed
+
+# One OCR service for both rounds and for the profiling worker processes.
+# The backend (and its model) is created once per process on first use and
+# shared by a pool of OCR_WORKERS threads; each image gets OCR_TIMEOUT
+# seconds. Backends take a grayscale image (see images.ocr_variant).
+
+log = get_logger(__name__)
+
+_TESSERACT_LANGS = {"en": "eng", "de": "deu", "fr": "fra", "es": "spa", "it": "ita", "pt": "por"}
+
+
+class OcrTimeout(Exception):
+    pass
+
+
+class TesseractBackend:
+    name = "tesseract"
+
+    def __init__(self, langs):
+        import pytesseract
+        self.pytesseract = pytesseract
+        self.lang = "+".join(_TESSERACT_LANGS.get(lang, lang) for lang in langs)
+
+    def read(self, gray):
+        import cv2
+        blur = cv2.GaussianBlur(gray, (5, 5), 0)
+        thresh = cv2.adaptiveThreshold(
+            blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY_INV, 11, 2
+        )
+        # pytesseract kills the tesseract process when the timeout expires
+        return self.pytesseract.image_to_string(thresh, lang=self.lang, config=r'--oem 3 --psm 6', timeout=OCR_TIMEOUT)
+
+
+class EasyOcrBackend:
+    name = "easyocr"
+
+    def __init__(self, langs):
+        import easyocr
+        self.reader = easyocr.Reader(langs, gpu=False, verbose=False)
+
+    def read(self, gray):
+        return " ".join(self.reader.readtext(gray, detail=0))
+
+
+BACKENDS = {
+    TesseractBackend.name: TesseractBackend,
+    EasyOcrBackend.name: EasyOcrBackend,
+}
+
+_backend = None
+_pool = None
+_lock = threading.Lock()
+
+
+def get_backend():
+    """The process-wide OCR backend, created on first use."""
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                if OCR_BACKEND not in BACKENDS:
+                    raise ValueError(f"Unknown OCR_BACKEND {OCR_BACKEND!r}, expected one of {sorted(BACKENDS)}")
+                langs = [lang.strip() for lang in OCR_LANGS.split(",") if lang.strip()]
+                with timed("ocr_load"):
+                    _backend = BACKENDS[OCR_BACKEND](langs)
+                log.info("Loaded OCR backend", extra={"backend": OCR_BACKEND, "langs": langs})
+    return _backend
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="ocr")
+    return _pool
+
+
+def _to_gray(img):
+    if img.ndim == 2:
+        return img
+    import cv2
+    return cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+
+
+def read_text(img):
+    """Returns (text, backend name) for a BGR or grayscale image; raises OcrTimeout after OCR_TIMEOUT seconds."""
+    backend = get_backend()
+    future = _get_pool().submit(backend.read, _to_gray(img))
+    with timed("ocr"):
+        try:
+            return future.result(timeout=OCR_TIMEOUT), backend.name
+        except FutureTimeout:
+            future.cancel()
+            raise OcrTimeout(f"OCR took longer than {OCR_TIMEOUT}s")
+
+
+def read_file(path, sha256=None):
+    """OCR of an image file, run on its cached grayscale variant."""
+    from images import ocr_variant
+    return read_text(ocr_variant(path, sha256))
+
+
+def warm_up():
+    get_backend()
@@ -0,0 +1,131 @@
+import json
+import sqlite3
+import threading
+import time
+from config import OUTBOX_PATH, OUTBOX_KEEP_DELIVERED, OUTBOX_LEASE
+
+# Durable queue of evaluator notifications. A row is written before the job
+# finishes and stays "pending" until the dispatcher gets a 2xx back, so a
+# restart only delays delivery. Rows that run past their deadline are kept
+# as "failed" for inspection. Several processes may share the file: a row
+# is claimed ("sending", with a lease) by one dispatcher before it is sent,
+# and a lease that runs out makes the row claimable again.
+
+PENDING="pending"
+SENDING="sending"
+DELIVERED="delivered"
+FAILED="failed"
+
+_local=threading.local()
+
+
+def _connect():
+    conn=getattr(_local, "conn", None)
+    if conn is None:
+        conn=sqlite3.connect(OUTBOX_PATH, timeout=30)
+        conn.row_factory=sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            state TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL,
+            deadline REAL NOT NULL,
+            last_error TEXT,
+            lease_until REAL,
+            created_at REAL,
+            updated_at REAL
+        )""")
+        columns={row["name"] for row in conn.execute("PRAGMA table_info(outbox)")}
+        if "lease_until" not in columns:
+            conn.execute("ALTER TABLE outbox ADD COLUMN lease_until REAL")
+        conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (state, next_attempt)")
+        _local.conn=conn
+    return conn
+
+
+def enqueue(url, payload, deadline):
+    """Stores a notification for delivery and returns its id."""
+    now=time.time()
+    conn=_connect()
+    with conn:
+        cur=conn.execute(
+            "INSERT INTO outbox (url, payload, state, next_attempt, deadline, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (url, json.dumps(payload), PENDING, now, now+deadline, now, now),
+        )
+    return cur.lastrowid
+
+
+_CLAIMABLE="(state=? AND next_attempt<=?) OR (state=? AND lease_until<=?)"
+
+
+def claim(limit=100, lease=OUTBOX_LEASE, exclude=()):
+    """
+    Claims up to limit due notifications for lease seconds and returns them,
+    oldest first. Each UPDATE only succeeds while the row is still
+    claimable, so a row goes to exactly one of the processes polling it.
+    """
+    now=time.time()
+    conn=_connect()
+    rows=conn.execute(
+        f"SELECT * FROM outbox WHERE {_CLAIMABLE} ORDER BY next_attempt LIMIT ?",
+        (PENDING, now, SENDING, now, limit+len(exclude)),
+    ).fetchall()
+    claimed=[]
+    for row in rows:
+        if row["id"] in exclude or len(claimed)>=limit:
+            continue
+        with conn:
+            cur=conn.execute(
+                f"UPDATE outbox SET state=?, lease_until=?, updated_at=? WHERE id=? AND ({_CLAIMABLE})",
+                (SENDING, now+lease, now, row["id"], PENDING, now, SENDING, now),
+            )
+        if cur.rowcount==1:
+            claimed.append(dict(row, payload=json.loads(row["payload"]), state=SENDING, lease_until=now+lease))
+    return claimed
+
+
+def next_due():
+    """Timestamp at which the next row becomes claimable, or None when nothing is outstanding."""
+    row=_connect().execute(
+        "SELECT MIN(CASE WHEN state=? THEN next_attempt ELSE lease_until END) FROM outbox WHERE state IN (?, ?)",
+        (PENDING, PENDING, SENDING),
+    ).fetchone()
+    return row[0]
+
+
+def get(item_id):
+    row=_connect().execute("SELECT * FROM outbox WHERE id=?", (item_id,)).fetchone()
+    return dict(row, payload=json.loads(row["payload"])) if row else None
+
+
+def mark_delivered(item_id):
+    _update(item_id, state=DELIVERED, last_error=None, lease_until=None)
+
+
+def mark_retry(item_id, attempts, next_attempt, error):
+    _update(item_id, state=PENDING, attempts=attempts, next_attempt=next_attempt, last_error=error, lease_until=None)
+
+
+def mark_failed(item_id, attempts, error):
+    _update(item_id, state=FAILED, attempts=attempts, last_error=error, lease_until=None)
+
+
+def _update(item_id, **fields):
+    fields["updated_at"]=time.time()
+    conn=_connect()
+    with conn:
+        conn.execute(
+            f"UPDATE outbox SET {', '.join(f'{c}=?' for c in fields)} WHERE id=?",
+            list(fields.values())+[item_id],
+        )
+
+
+def prune():
+    """Drops delivered rows older than OUTBOX_KEEP_DELIVERED seconds."""
+    conn=_connect()
+    with conn:
+        conn.execute("DELETE FROM outbox WHERE state=? AND updated_at<?", (DELIVERED, time.time()-OUTBOX_KEEP_DELIVERED))
@@ -0,0 +1,87 @@
+import asyncio
+import inspect
+import time
+from log import get_logger
+from metrics import STAGE_SECONDS, STAGE_ERRORS
+
+log=get_logger(__name__)
+
+
+class StageFailed(Exception):
+    def __init__(self, stage, error, timings):
+        super().__init__(f"Stage {stage} failed: {error}")
+        self.stage=stage
+        self.error=error
+        self.timings=timings
+
+
+class Pipeline:
+    """
+    Small DAG scheduler for the stages of one job. Each stage is started as
+    soon as the stages it depends on have finished, so independent work
+    (creating the repo while the LLM is generating, writing README/LICENSE
+    while attachments are profiled) overlaps. A stage receives the results of
+    its dependencies as keyword arguments; blocking functions run in a thread.
+    The first failure cancels whatever is still running.
+    """
+
+    def __init__(self, name, job=None):
+        self.name=name
+        self.job=job
+        self.stages={}
+        self.timings={}
+
+    def add(self, name, fn, deps=()):
+        # Dependencies must be declared first, which also rules out cycles
+        missing=[d for d in deps if d not in self.stages]
+        if missing:
+            raise ValueError(f"Stage {name} depends on unknown stages {missing}")
+        self.stages[name]=(fn, tuple(deps))
+        return self
+
+    async def _run_stage(self, name, tasks, started):
+        fn, deps=self.stages[name]
+        kwargs={dep: await tasks[dep] for dep in deps}
+        begin=time.perf_counter()
+        self.timings[name]={"start": round(begin-started, 3), "seconds": None, "state": "running"}
+        try:
+            if inspect.iscoroutinefunction(fn):
+                result=await fn(**kwargs)
+            else:
+                result=await asyncio.to_thread(fn, **kwargs)
+        except asyncio.CancelledError:
+            self.timings[name].update(seconds=round(time.perf_counter()-begin, 3), state="cancelled")
+            raise
+        except Exception:
+            seconds=time.perf_counter()-begin
+            self.timings[name].update(seconds=round(seconds, 3), state="failed")
+            STAGE_ERRORS.labels(self.name, name).inc()
+            raise
+        seconds=time.perf_counter()-begin
+        self.timings[name].update(seconds=round(seconds, 3), state="done")
+        STAGE_SECONDS.labels(self.name, name).observe(seconds)
+        log.debug("Stage finished", extra={"pipeline": self.name, "job": self.job, "stage": name, "seconds": round(seconds, 3)})
+        return result
+
+    async def run(self):
+        """Runs every stage and returns {stage: result}; raises StageFailed on the first error."""
+        started=time.perf_counter()
+        tasks={}
+        for name in self.stages:
+            tasks[name]=asyncio.create_task(self._run_stage(name, tasks, started))
+        pending=set(tasks.values())
+        while pending:
+            done, pending=await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+            failed=[(n, t) for n, t in tasks.items() if t in done and not t.cancelled() and t.exception()]
+            if failed:
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                # Report the stage that raised, not a dependent that re-raised its error while waiting
+                name, task=next(((n, t) for n, t in failed if self.timings.get(n, {}).get("state")=="failed"), failed[0])
+                raise StageFailed(name, task.exception(), self.timings) from task.exception()
+        total=time.perf_counter()-started
+        summary=", ".join(f"{n} {t['seconds']:.2f}s" for n, t in self.timings.items())
+        log.info("Pipeline finished in %.2fs (%s)", total, summary, extra={"pipeline": self.name, "job": self.job})
+        self.timings["total"]={"start": 0.0, "seconds": round(total, 3), "state": "done"}
+        return {name: task.result() for name, task in tasks.items()}
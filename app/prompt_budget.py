@@ -0,0 +1,164 @@
+import copy
+import re
+from config import LLM_PROMPT_TOKEN_BUDGET, IMAGE_LLM_DETAIL
+from log import get_logger
+from describe import serialize
+
+log=get_logger(__name__)
+
+_encoding = None
+_encoding_loaded = False
+
+
+def get_encoding():
+    """Loads the tiktoken encoding on first use; None when tiktoken is unavailable."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+# Rough per-image cost of a vision request: a typical high-detail image is
+# four 512px tiles (4 * 170) plus the 85 token base; "low" is the base only
+IMAGE_TOKENS = {"auto": 765, "high": 765, "low": 85}
+
+_STYLE_RE = re.compile(r"(<style\b[^>]*>)(.*?)(</style>)", re.DOTALL | re.IGNORECASE)
+_INLINE_SCRIPT_RE = re.compile(r"(<script\b(?![^>]*\bsrc=)[^>]*>)(.*?)(</script>)", re.DOTALL | re.IGNORECASE)
+
+
+def count_tokens(text):
+    """Token count with tiktoken when installed, otherwise the usual ~4 characters per token estimate."""
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def _walk(value, fn):
+    if isinstance(value, dict):
+        for key in list(value):
+            value[key] = fn(key, value[key])
+            _walk(value[key], fn)
+    elif isinstance(value, list):
+        for item in value:
+            _walk(item, fn)
+
+
+def trim_samples(description, rows=1, max_chars=120):
+    """Keeps one sample row per table and shortens long sample strings."""
+    def fn(key, value):
+        if key == "sample" and isinstance(value, list):
+            return value[:rows]
+        if key in ("sample", "ocr_text_sample") and isinstance(value, str) and len(value) > max_chars:
+            return value[:max_chars] + "..."
+        return value
+    _walk(description, fn)
+    return description
+
+
+def summarize(description, max_keys=20):
+    """Drops samples and dtypes altogether, keeping only types, shapes and column/key names."""
+    def fn(key, value):
+        if isinstance(value, dict):
+            for dropped in ("sample", "ocr_text_sample", "dtypes"):
+                value.pop(dropped, None)
+        if key in ("keys", "columns") and isinstance(value, list) and len(value) > max_keys:
+            return value[:max_keys] + [f"... {len(value) - max_keys} more"]
+        return value
+    _walk(description, fn)
+    return description
+
+
+def collapse_inline_code(html):
+    """Replaces the bodies of <style> and inline <script> blocks with a placeholder."""
+    html = _STYLE_RE.sub(lambda m: f"{m.group(1)}/* {len(m.group(2))} chars of CSS omitted */{m.group(3)}", html)
+    return _INLINE_SCRIPT_RE.sub(lambda m: f"{m.group(1)}/* {len(m.group(2))} chars of JS omitted */{m.group(3)}", html)
+
+
+def _truncate_tokens(text, tokens):
+    if count_tokens(text) <= tokens:
+        return text
+    # Approximate cut, then tighten; good enough for a last-resort trim
+    chars = max(tokens * 4, 0)
+    while chars > 0 and count_tokens(text[:chars]) > tokens:
+        chars = int(chars * 0.9)
+    return text[:chars] + "\n... (truncated)"
+
+
+def assemble(build_prompt, description, html=None, images=(), budget=LLM_PROMPT_TOKEN_BUDGET):
+    """
+    Builds a prompt that fits in budget tokens, degrading in this order
+    until it does:
+      1. trim data samples to one row and shorten long strings
+      2. collapse inline CSS/JS in the existing page (round 2)
+      3. ask for low-detail images
+      4. summarise the data description (no samples or dtypes)
+      5. drop images, last first
+      6. truncate the page, then the data description
+    build_prompt(description, html) must return the prompt text.
+
+    Returns (prompt, image_parts, report) where image_parts is a list of
+    (attachment, detail) and report lists the steps that were applied.
+    """
+    description = copy.deepcopy(description)
+    image_parts = [(image, IMAGE_LLM_DETAIL) for image in images]
+    cuts = []
+
+    def total():
+        prompt = build_prompt(description, html)
+        return prompt, count_tokens(prompt) + sum(IMAGE_TOKENS.get(d, IMAGE_TOKENS["auto"]) for _, d in image_parts)
+
+    prompt, tokens = total()
+    report = {"budget": budget, "tokens_before": tokens, "cuts": cuts}
+
+    def collapse_page():
+        nonlocal html
+        html = collapse_inline_code(html)
+
+    def low_detail_images():
+        nonlocal image_parts
+        image_parts = [(image, "low") for image, _ in image_parts]
+
+    steps = []
+    if isinstance(description, (dict, list)):
+        steps.append(("trimmed data samples", lambda: trim_samples(description)))
+    if html:
+        steps.append(("collapsed inline CSS/JS in the existing page", collapse_page))
+    if image_parts:
+        steps.append(("requested low-detail images", low_detail_images))
+    if isinstance(description, (dict, list)):
+        steps.append(("summarised data description", lambda: summarize(description)))
+
+    for name, step in steps:
+        if tokens <= budget:
+            break
+        step()
+        cuts.append(name)
+        prompt, tokens = total()
+
+    while tokens > budget and image_parts:
+        dropped, _ = image_parts.pop()
+        cuts.append(f"dropped image {dropped.name}")
+        prompt, tokens = total()
+
+    if tokens > budget and html:
+        overflow = tokens - budget
+        html = _truncate_tokens(html, max(count_tokens(html) - overflow, 0))
+        cuts.append("truncated the existing page")
+        prompt, tokens = total()
+
+    if tokens > budget:
+        text = serialize(description)
+        overflow = tokens - budget
+        description = _truncate_tokens(text, max(count_tokens(text) - overflow, 0))
+        cuts.append("truncated the data description")
+        prompt, tokens = total()
+
+    report["tokens_after"] = tokens
+    if cuts:
+        log.info("Prompt over budget, applied: %s", ", ".join(cuts), extra={"tokens_before": report["tokens_before"], "budget": budget, "tokens": tokens})
+    return prompt, image_parts, report
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from log import get_logger
+from metrics import UPSTREAM_IN_FLIGHT
+from config import (
+    LLM_RATE, LLM_BURST, LLM_MAX_IN_FLIGHT,
+    GITHUB_RATE, GITHUB_BURST, GITHUB_MAX_IN_FLIGHT,
+    EVALUATOR_RATE, EVALUATOR_BURST, EVALUATOR_MAX_IN_FLIGHT,
+)
+
+log=get_logger(__name__)
+
+LIMITS={
+    "llm": (LLM_RATE, LLM_BURST, LLM_MAX_IN_FLIGHT),
+    "github": (GITHUB_RATE, GITHUB_BURST, GITHUB_MAX_IN_FLIGHT),
+    "evaluator": (EVALUATOR_RATE, EVALUATOR_BURST, EVALUATOR_MAX_IN_FLIGHT),
+}
+
+
+class Upstream:
+    """
+    Token bucket plus an in-flight cap for one upstream service. Responses
+    are fed back through observe(): a Retry-After header or an exhausted
+    GitHub X-RateLimit-Remaining pauses every caller until the upstream
+    says it is ready, instead of each of them failing on its own.
+    """
+
+    def __init__(self, name, rate, burst, max_in_flight):
+        self.name=name
+        self.rate=rate
+        self.burst=burst
+        self.tokens=float(burst)
+        self.updated=time.monotonic()
+        self.blocked_until=0.0
+        self.in_flight=0
+        self._slots=asyncio.Semaphore(max_in_flight)
+        self._lock=asyncio.Lock()
+
+    async def _take_token(self):
+        async with self._lock:
+            while True:
+                now=time.monotonic()
+                if now<self.blocked_until:
+                    await asyncio.sleep(self.blocked_until-now)
+                    continue
+                self.tokens=min(self.burst, self.tokens+(now-self.updated)*self.rate)
+                self.updated=now
+                if self.tokens>=1:
+                    self.tokens-=1
+                    return
+                await asyncio.sleep((1-self.tokens)/self.rate)
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._slots:
+            await self._take_token()
+            self.in_flight+=1
+            UPSTREAM_IN_FLIGHT.labels(self.name).inc()
+            try:
+                yield self
+            finally:
+                self.in_flight-=1
+                UPSTREAM_IN_FLIGHT.labels(self.name).dec()
+
+    def block_for(self, seconds):
+        until=time.monotonic()+seconds
+        if until>self.blocked_until:
+            log.warning("Pausing upstream calls for %.1fs", seconds, extra={"upstream": self.name})
+            self.blocked_until=until
+
+    def observe(self, response):
+        headers=response.headers
+        retry_after=headers.get("Retry-After")
+        if retry_after and response.status_code in (403, 429, 503):
+            try:
+                self.block_for(float(retry_after))
+            except ValueError:
+                pass
+        remaining=headers.get("X-RateLimit-Remaining")
+        reset=headers.get("X-RateLimit-Reset")
+        if remaining is not None and reset is not None:
+            try:
+                if int(remaining)<=0:
+                    # Reset is a UTC epoch timestamp
+                    self.block_for(max(float(reset)-time.time(), 0))
+            except ValueError:
+                pass
+
+
+_upstreams={}
+
+
+def get_upstream(name):
+    if name not in _upstreams:
+        rate, burst, max_in_flight=LIMITS[name]
+        _upstreams[name]=Upstream(name, rate, burst, max_in_flight)
+    return _upstreams[name]
+
+
+def reset():
+    # asyncio primitives belong to one event loop; drop them with the client
+    _upstreams.clear()
@@ -0,0 +1,126 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+from config import SNAPSHOT_CACHE_DIR, SNAPSHOT_CACHE_MAX_BYTES
+from log import get_logger
+
+log=get_logger(__name__)
+
+# Layout: <SNAPSHOT_CACHE_DIR>/<task>/<commit_sha>/<published files>
+# plus a <commit_sha>.size file next to each snapshot. The snapshot
+# directory's mtime is bumped on every read and used for LRU eviction.
+
+_lock=threading.Lock()
+
+
+def _task_dir(task):
+    # task comes from the client; store() deletes the siblings of the snapshot, so it must stay one level down
+    name=re.sub(r"[^A-Za-z0-9_.-]", "_", task)
+    if name in ("", ".", ".."):
+        raise ValueError(f"Invalid task name for the snapshot cache: {task!r}")
+    return os.path.join(SNAPSHOT_CACHE_DIR, name)
+
+
+def _tree_size(path):
+    total=0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total+=os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def _copy_tree(src, dst):
+    for root, dirs, files in os.walk(src):
+        dirs[:]=[d for d in dirs if d!=".git"]
+        rel=os.path.relpath(root, src)
+        os.makedirs(os.path.join(dst, rel), exist_ok=True)
+        for name in files:
+            shutil.copy2(os.path.join(root, name), os.path.join(dst, rel, name))
+
+
+def lookup(task):
+    """Returns (commit_sha, path) of the cached snapshot for task, or (None, None)."""
+    task_dir=_task_dir(task)
+    with _lock:
+        if not os.path.isdir(task_dir):
+            return None, None
+        shas=[d for d in os.listdir(task_dir) if os.path.isdir(os.path.join(task_dir, d))]
+        if not shas:
+            return None, None
+        sha=max(shas, key=lambda d: os.path.getmtime(os.path.join(task_dir, d)))
+        path=os.path.join(task_dir, sha)
+        os.utime(path)
+        return sha, path
+
+
+def store(task, commit_sha, src_dir, base_dir=None):
+    """
+    Saves the published tree for task at commit_sha. When base_dir is given
+    (round 2 only uploads the changed files) its contents are copied first
+    and src_dir is laid over them, so the snapshot matches the remote tree.
+    Older snapshots of the same task are dropped.
+    """
+    task_dir=_task_dir(task)
+    os.makedirs(task_dir, exist_ok=True)
+    target=os.path.join(task_dir, commit_sha)
+    staging=tempfile.mkdtemp(dir=task_dir, prefix=".staging-")
+    try:
+        if base_dir:
+            _copy_tree(base_dir, staging)
+        _copy_tree(src_dir, staging)
+        size=_tree_size(staging)
+        with _lock:
+            if os.path.exists(target):
+                shutil.rmtree(staging, ignore_errors=True)
+            else:
+                os.rename(staging, target)
+                with open(target+".size", "w") as f:
+                    f.write(str(size))
+            for other in os.listdir(task_dir):
+                other_path=os.path.join(task_dir, other)
+                if other!=commit_sha and os.path.isdir(other_path) and not other.startswith(".staging-"):
+                    _remove(other_path)
+            _evict()
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    log.info("Cached snapshot", extra={"task": task, "commit": commit_sha})
+    return target
+
+
+def _remove(path):
+    shutil.rmtree(path, ignore_errors=True)
+    if os.path.exists(path+".size"):
+        os.remove(path+".size")
+
+
+def _snapshot_size(path):
+    try:
+        with open(path+".size") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return _tree_size(path)
+
+
+def _evict():
+    # Called with _lock held
+    snapshots=[]
+    if not os.path.isdir(SNAPSHOT_CACHE_DIR):
+        return
+    for task in os.listdir(SNAPSHOT_CACHE_DIR):
+        task_dir=os.path.join(SNAPSHOT_CACHE_DIR, task)
+        if not os.path.isdir(task_dir):
+            continue
+        for sha in os.listdir(task_dir):
+            path=os.path.join(task_dir, sha)
+            if os.path.isdir(path) and not sha.startswith(".staging-"):
+                snapshots.append((os.path.getmtime(path), path, _snapshot_size(path)))
+    total=sum(size for _, _, size in snapshots)
+    for _, path, size in sorted(snapshots):
+        if total<=SNAPSHOT_CACHE_MAX_BYTES:
+            break
+        log.info("Evicting snapshot", extra={"path": path})
+        _remove(path)
+        total-=size
@@ -0,0 +1,85 @@
+import importlib
+import sys
+import time
+
+# Imported first by main.py so it can time the imports that follow. Each
+# top-level module's import time is recorded, including whatever that
+# module imports in turn. Heavy libraries (pandas, numpy, cv2, bs4, ...)
+# are imported inside the functions that use them, and warm_up() loads
+# them in the background once the app is already accepting requests.
+
+STARTED=time.perf_counter()
+
+_imports={}
+_report={"ready_seconds": None, "warmup": {}, "warmup_seconds": None}
+
+
+class _ImportTimer:
+    """Meta path finder that only delegates, wrapping each top-level module's exec_module with a timer."""
+
+    def find_spec(self, name, path=None, target=None):
+        if "." in name or name in _imports:
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec=finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader=spec.loader
+        # Built-in and frozen importers are shared classes, leave them alone
+        if loader is None or isinstance(loader, type) or not hasattr(loader, "exec_module"):
+            return spec
+        exec_module=loader.exec_module
+
+        def timed_exec_module(module):
+            start=time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                _imports[name]=time.perf_counter()-start
+
+        loader.exec_module=timed_exec_module
+        return spec
+
+
+_timer=_ImportTimer()
+sys.meta_path.insert(0, _timer)
+
+
+def mark_ready():
+    """Called once the app can serve requests; stops timing imports."""
+    if _timer in sys.meta_path:
+        sys.meta_path.remove(_timer)
+    _report["ready_seconds"]=round(time.perf_counter()-STARTED, 3)
+
+
+def warm_up(modules):
+    """Imports each module (blocking; run it in a thread) and records how long it took."""
+    start=time.perf_counter()
+    for name in modules:
+        begin=time.perf_counter()
+        try:
+            module=importlib.import_module(name)
+            if name=="tiktoken":
+                import prompt_budget
+                prompt_budget.get_encoding()
+            # App modules can preload models or other state
+            elif callable(getattr(module, "warm_up", None)):
+                module.warm_up()
+            _report["warmup"][name]=round(time.perf_counter()-begin, 3)
+        except Exception as e:
+            _report["warmup"][name]=f"failed: {e}"
+    _report["warmup_seconds"]=round(time.perf_counter()-start, 3)
+
+
+def report(top=20):
+    slowest=sorted(_imports.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "ready_seconds": _report["ready_seconds"],
+        "imports": {name: round(seconds, 3) for name, seconds in slowest},
+        "warmup": _report["warmup"],
+        "warmup_seconds": _report["warmup_seconds"],
+    }
@@ -0,0 +1,105 @@
+import sqlite3
+import threading
+import time
+from config import TASK_STORE_PATH, TASK_STORE_CACHE_TTL
+
+# SQLite in WAL mode so several uvicorn workers can read while one writes.
+# Each thread gets its own connection; reads go through a small in-memory
+# cache that expires after TASK_STORE_CACHE_TTL seconds so that updates made
+# by another worker are picked up.
+
+FIELDS=["repo_url", "html_url", "pages_url", "full_name", "commit_sha", "brief"]
+
+_local=threading.local()
+_cache={}
+_cache_lock=threading.Lock()
+
+
+def _connect():
+    conn=getattr(_local, "conn", None)
+    if conn is None:
+        conn=sqlite3.connect(TASK_STORE_PATH, timeout=30)
+        conn.row_factory=sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS tasks (
+            email TEXT NOT NULL,
+            task TEXT NOT NULL,
+            repo_url TEXT,
+            html_url TEXT,
+            pages_url TEXT,
+            full_name TEXT,
+            commit_sha TEXT,
+            brief TEXT,
+            updated_at REAL,
+            PRIMARY KEY (email, task)
+        )""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS requests (
+            email TEXT NOT NULL,
+            task TEXT NOT NULL,
+            round INTEGER NOT NULL,
+            nonce TEXT NOT NULL,
+            repo_url TEXT,
+            commit_sha TEXT,
+            pages_url TEXT,
+            completed_at REAL,
+            PRIMARY KEY (email, task, round, nonce)
+        )""")
+        _local.conn=conn
+    return conn
+
+
+def get_task(email, task):
+    """Returns the stored record for (email, task) as a dict, or None."""
+    key=(email, task)
+    with _cache_lock:
+        hit=_cache.get(key)
+        if hit and time.time()-hit[0]<TASK_STORE_CACHE_TTL:
+            return dict(hit[1])
+    row=_connect().execute("SELECT * FROM tasks WHERE email=? AND task=?", key).fetchone()
+    if row is None:
+        return None
+    record=dict(row)
+    with _cache_lock:
+        _cache[key]=(time.time(), record)
+    return dict(record)
+
+
+def save_task(email, task, **fields):
+    """Inserts or updates (email, task); only the given fields are overwritten."""
+    unknown=set(fields)-set(FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown task fields: {sorted(unknown)}")
+    conn=_connect()
+    columns=list(fields)
+    now=time.time()
+    updates=", ".join(f"{c}=excluded.{c}" for c in columns+["updated_at"])
+    with conn:
+        conn.execute(
+            f"INSERT INTO tasks (email, task, {', '.join(columns+['updated_at'])}) "
+            f"VALUES (?, ?, {', '.join('?' for _ in columns+['updated_at'])}) "
+            f"ON CONFLICT(email, task) DO UPDATE SET {updates}",
+            [email, task]+[fields[c] for c in columns]+[now],
+        )
+    with _cache_lock:
+        _cache.pop((email, task), None)
+
+
+def get_request(email, task, round, nonce):
+    """Returns the stored outcome of a completed request, or None if it never finished."""
+    row=_connect().execute(
+        "SELECT * FROM requests WHERE email=? AND task=? AND round=? AND nonce=?",
+        (email, task, round, nonce),
+    ).fetchone()
+    return dict(row) if row else None
+
+
+def save_request(email, task, round, nonce, repo_url, commit_sha, pages_url):
+    """Records the outcome of a completed request so duplicates can be answered without redoing it."""
+    conn=_connect()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO requests (email, task, round, nonce, repo_url, commit_sha, pages_url, completed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (email, task, round, nonce, repo_url, commit_sha, pages_url, time.time()),
+        )
@@ -0,0 +1,55 @@
+import os
+import re
+import shutil
+import tempfile
+from config import WORKSPACE_ROOT, WORKSPACE_TMPFS, WORKSPACE_QUOTA_BYTES
+
+
+class WorkspaceQuotaExceeded(Exception):
+    pass
+
+
+class Workspace:
+    """
+    Private scratch directory for one job. Every stage of process_request
+    writes under it, so concurrent jobs never share file names, and it is
+    removed when the job ends whatever the outcome.
+
+    Layout:
+        attachments/  decoded request attachments
+        publish/      the tree that is pushed to GitHub
+        scratch/      anything else (clones, intermediate files)
+    """
+
+    def __init__(self, nonce, quota_bytes=WORKSPACE_QUOTA_BYTES):
+        root = "/dev/shm" if WORKSPACE_TMPFS and os.path.isdir("/dev/shm") else WORKSPACE_ROOT
+        safe_nonce = re.sub(r"[^A-Za-z0-9_.-]", "_", nonce)[:64]
+        self.path = tempfile.mkdtemp(prefix=f"job-{safe_nonce}-", dir=root)
+        self.quota_bytes = quota_bytes
+        self.reserved = 0
+        self.attachments_dir = self.subdir("attachments")
+        self.publish_dir = self.subdir("publish")
+        self.scratch_dir = self.subdir("scratch")
+
+    def subdir(self, name):
+        path = os.path.join(self.path, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def reserve(self, nbytes):
+        """Accounts for nbytes about to be written; raises once the job would exceed its quota."""
+        if self.reserved + nbytes > self.quota_bytes:
+            raise WorkspaceQuotaExceeded(
+                f"Workspace quota of {self.quota_bytes} bytes exceeded ({self.reserved + nbytes} requested)"
+            )
+        self.reserved += nbytes
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+        return False
@@ -0,0 +1,102 @@
+"""
+Micro-benchmark for describe.describe_attachments against the description
+block that used to be duplicated in generate_app_code and revise_app_code.
+Reports the time per call and the size of the text that ends up in the prompt.
+
+    python benchmarks/bench_describe.py [--rows 20000] [--repeat 20] [--mode sample|full]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import describe
+from file_handling import process_attachments, TableProfile, DatabaseProfile, ImageProfile
+from prompt_budget import count_tokens
+
+
+def legacy_describe(file_paths, mode):
+    # The previous per-round implementation, kept here for comparison (images omitted)
+    import pandas as pd
+    file_info = process_attachments(file_paths, mode=mode)
+    data_description = {}
+    for filename, data in file_info.items():
+        if isinstance(data, (TableProfile, DatabaseProfile, ImageProfile)):
+            data_description[filename] = data.describe()
+        elif isinstance(data, pd.DataFrame):
+            data_description[filename] = {
+                "type": "DataFrame",
+                "shape": data.shape,
+                "columns": list(data.columns),
+                "sample": data.head(3).to_dict(orient="records")
+            }
+        elif isinstance(data, dict):
+            data_description[filename] = {"type": "Dictionary", "keys": list(data.keys()) if data else []}
+        elif isinstance(data, list):
+            data_description[filename] = {"type": "List", "length": len(data), "sample": data[:2] if len(data) > 0 else []}
+        elif isinstance(data, str):
+            data_description[filename] = {"type": "String", "length": len(data), "sample": data if len(data) <= 200 else data[:200] + "..."}
+        else:
+            data_description[filename] = {"type": type(data).__name__, "info": "Available for processing"}
+    # The old prompt interpolated the dict directly
+    return f"{data_description}"
+
+
+def make_attachments(directory, rows, rng):
+    paths = {}
+    csv_path = os.path.join(directory, "sales.csv")
+    with open(csv_path, "w") as f:
+        f.write("date,region,product,units,price,notes\n")
+        for i in range(rows):
+            f.write(f"2024-{1 + i % 12:02d}-{1 + i % 28:02d},region {i % 7},product {i % 50},{rng.randrange(100)},{rng.random() * 100:.2f},\"{'lorem ipsum ' * rng.randrange(1, 20)}\"\n")
+    paths["sales.csv"] = csv_path
+    records = [{"id": i, "name": f"user {i}", "tags": ["a", "b", "c"] * 5, "bio": "x" * 500} for i in range(2000)]
+    with open(os.path.join(directory, "users.json"), "w") as f:
+        json.dump(records, f)
+    paths["users.json"] = os.path.join(directory, "users.json")
+    config = {f"key_{i}": {"enabled": bool(i % 2), "values": list(range(50)), "label": "y" * 300} for i in range(100)}
+    with open(os.path.join(directory, "config.json"), "w") as f:
+        json.dump(config, f)
+    paths["config.json"] = os.path.join(directory, "config.json")
+    with open(os.path.join(directory, "notes.md"), "w") as f:
+        f.write("# Notes\n\n" + "Some long paragraph of text. " * 2000)
+    paths["notes.md"] = os.path.join(directory, "notes.md")
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--mode", default="sample", choices=["sample", "full"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_attachments(directory, args.rows, random.Random(0))
+
+        legacy_text = legacy_describe(paths, args.mode)
+        new_text = describe.serialize(describe.describe_attachments(paths, mode=args.mode))
+
+        def cold_describe():
+            describe._memo.clear()
+            describe.describe_attachments(paths, mode=args.mode)
+
+        # Best of --repeat single runs, as in bench_html_extract.py; the means are dominated by noise
+        legacy = min(timeit.repeat(lambda: legacy_describe(paths, args.mode), number=1, repeat=args.repeat))
+        cold = min(timeit.repeat(cold_describe, number=1, repeat=args.repeat))
+        warm = min(timeit.repeat(lambda: describe.describe_attachments(paths, mode=args.mode), number=1, repeat=args.repeat))
+
+        print(f"mode={args.mode}, {len(paths)} attachments, csv rows={args.rows}")
+        print(f"{'':16}{'ms/call':>10}{'chars':>10}{'tokens':>10}")
+        print(f"{'legacy':16}{legacy * 1000:>10.2f}{len(legacy_text):>10}{count_tokens(legacy_text):>10}")
+        print(f"{'engine (cold)':16}{cold * 1000:>10.2f}{len(new_text):>10}{count_tokens(new_text):>10}")
+        print(f"{'engine (memo)':16}{warm * 1000:>10.2f}{len(new_text):>10}{count_tokens(new_text):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark for html_extract.extract_html against the regex extractor
+that used to be nested inside process_request.
+
+    python benchmarks/bench_html_extract.py [--size-kb 300] [--repeat 50]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from html_extract import extract_html
+
+
+def legacy_extract(response):
+    # The previous per-call implementation, kept here for comparison
+    response = response.strip()
+    if re.match(r"^(<!DOCTYPE|<html)", response, re.IGNORECASE):
+        return response
+    fence_pattern = re.compile(r"```html\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+    match = fence_pattern.search(response)
+    if match:
+        html_code = match.group(1).strip()
+        if re.match(r"^(<!DOCTYPE|<html)", html_code, re.IGNORECASE):
+            return html_code
+    doctype_match = re.search(r"<!DOCTYPE", response, re.IGNORECASE)
+    if doctype_match:
+        html_code = response[doctype_match.start():].strip()
+        end_html = re.search(r"</html>", html_code, re.IGNORECASE)
+        if end_html:
+            html_code = html_code[:end_html.end()]
+        return html_code
+
+
+def make_document(size_kb, rng):
+    css = "".join(f".c{i} {{ color: #{rng.randrange(0xffffff):06x}; margin: {i % 9}px; }}\n" for i in range(200))
+    rows = []
+    while sum(len(r) for r in rows) < size_kb * 1024:
+        rows.append(f"<tr><td>{rng.random():.6f}</td><td>item {len(rows)}</td><td><a href='#r{len(rows)}'>link</a></td></tr>\n")
+    js = "const data = " + str([rng.randrange(1000) for _ in range(500)]) + ";\nfunction render(){ return data.map(x => `<li>${x}</li>`).join(''); }\n"
+    return (
+        "<!DOCTYPE html>\n<html lang='en'>\n<head>\n<meta charset='utf-8'>\n<title>Generated</title>\n"
+        f"<style>\n{css}</style>\n</head>\n<body>\n<table>\n{''.join(rows)}</table>\n"
+        f"<script>\n{js}</script>\n</body>\n</html>"
+    )
+
+
+def make_cases(size_kb, rng):
+    doc = make_document(size_kb, rng)
+    preamble = "Sure! Below is the complete index.html for your app. " * 20
+    notes = "\n\nNotes:\n- The page fetches data.csv on load.\n- Styles are inline.\n" * 10
+    return {
+        "raw document": doc,
+        "fenced with prose": f"{preamble}\n```html\n{doc}\n```{notes}",
+        "several fences": f"{preamble}\n```js\nconsole.log('x')\n```\n```html\n<!DOCTYPE html><html><body>draft</body></html>\n```\n{preamble}\n```html\n{doc}\n```{notes}",
+        "unfenced with prose": f"{preamble}\n{doc}{notes}",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-kb", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    cases = make_cases(args.size_kb, random.Random(0))
+    print(f"{'case':<22}{'bytes':>10}{'legacy ms':>12}{'extract ms':>12}  method")
+    for name, text in cases.items():
+        legacy = min(timeit.repeat(lambda: legacy_extract(text), number=1, repeat=args.repeat)) * 1000
+        new = min(timeit.repeat(lambda: extract_html(text), number=1, repeat=args.repeat)) * 1000
+        result = extract_html(text)
+        print(f"{name:<22}{len(text):>10}{legacy:>12.3f}{new:>12.3f}  {result.method} (trimmed {result.trimmed_bytes} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Local stand-ins for the upstreams the app talks to, so the whole pipeline can
+be driven without aipipe, GitHub or a real evaluator:
+
+* POST /v1/chat/completions: OpenAI-compatible completions (plain and
+  streamed) that answer with a small HTML page after a configurable latency
+* the subset of the GitHub REST API the app uses (user, create/get repo, Pages,
+  Git Data blobs/trees/commits/refs), backed by bare repositories on disk
+  whose clone_url is a file:// URL, so the git publish backend works too
+* POST /evaluate: evaluator sink; GET /evaluations lists what it received
+
+    python loadtest/fakes.py [--port 9000] [--llm-latency 2] [--llm-jitter 0.5] [--github-latency 0.05]
+
+Point the app at it with
+    LLM_API_URL=http://127.0.0.1:9000/v1/chat/completions GITHUB_API=http://127.0.0.1:9000
+"""
+import argparse
+import asyncio
+import base64
+import html
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def git(repo, *args, input=None, env=None):
+    result = subprocess.run(["git", *args], cwd=repo, input=input, capture_output=True, env=env)
+    if result.returncode != 0:
+        raise HTTPException(status_code=422, detail=result.stderr.decode("utf-8", "replace").strip())
+    return result.stdout.decode("utf-8").strip()
+
+
+def _commit_env():
+    return dict(os.environ, GIT_AUTHOR_NAME="bot", GIT_AUTHOR_EMAIL="bot@example.com",
+                GIT_COMMITTER_NAME="bot", GIT_COMMITTER_EMAIL="bot@example.com")
+
+
+def init_repo(path, branch):
+    """Creates a bare repository with an initial README commit on branch."""
+    os.makedirs(path)
+    git(path, "init", "--bare", "-q", "-b", branch)
+    blob = git(path, "hash-object", "-w", "--stdin", input=b"# Repository\n")
+    tree = git(path, "mktree", input=f"100644 blob {blob}\tREADME.md\n".encode())
+    commit = git(path, "commit-tree", tree, "-m", "Initial commit", env=_commit_env())
+    git(path, "update-ref", f"refs/heads/{branch}", commit)
+
+
+def write_tree(path, base_tree, entries):
+    """Layers entries ({path, mode, sha}) over base_tree using a throwaway index."""
+    fd, index = tempfile.mkstemp(prefix="index-")
+    os.close(fd)
+    os.unlink(index)
+    env = dict(os.environ, GIT_INDEX_FILE=index)
+    try:
+        if base_tree:
+            git(path, "read-tree", base_tree, env=env)
+        info = "".join(f"{e.get('mode', '100644')} {e['sha']}\t{e['path']}\n" for e in entries if e.get("sha"))
+        if info:
+            git(path, "update-index", "--add", "--index-info", input=info.encode(), env=env)
+        return git(path, "write-tree", env=env)
+    finally:
+        if os.path.exists(index):
+            os.unlink(index)
+
+
+def fake_page(prompt, chars):
+    title = html.escape(prompt.strip().splitlines()[0][:200] if prompt.strip() else "App")
+    padding = "x" * max(0, chars - 200)
+    return f"<!DOCTYPE html>\n<html><head><title>Generated app</title></head>\n<body><h1>{title}</h1>\n<!-- {padding} -->\n</body></html>\n"
+
+
+def _prompt_text(messages):
+    content = messages[-1].get("content", "") if messages else ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+    return content
+
+
+def create_app(args):
+    app = FastAPI()
+    rng = random.Random(args.seed)
+    repo_root = args.repo_root
+    evaluations = []
+
+    def repo_path(owner, name):
+        return os.path.join(repo_root, owner, f"{name}.git")
+
+    def existing_repo(owner, name):
+        path = repo_path(owner, name)
+        if not os.path.isdir(path):
+            raise HTTPException(status_code=404, detail="Not Found")
+        return path
+
+    def repo_json(owner, name):
+        path = existing_repo(owner, name)
+        return {
+            "name": name,
+            "full_name": f"{owner}/{name}",
+            "owner": {"login": owner},
+            "html_url": f"{args.public_url}/{owner}/{name}",
+            "clone_url": f"file://{os.path.abspath(path)}",
+            "default_branch": args.branch,
+        }
+
+    async def github_delay():
+        if args.github_latency:
+            await asyncio.sleep(args.github_latency)
+
+    # LLM
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        prompt = _prompt_text(body.get("messages", []))
+        page = fake_page(prompt, args.llm_chars)
+        latency = max(0.0, args.llm_latency + rng.uniform(-args.llm_jitter, args.llm_jitter))
+        if args.llm_error_rate and rng.random() < args.llm_error_rate:
+            await asyncio.sleep(latency / 2)
+            return JSONResponse({"error": {"message": "Simulated overload"}}, status_code=503, headers={"Retry-After": "1"})
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(page) // 4, "total_tokens": (len(prompt) + len(page)) // 4}
+
+        if body.get("stream"):
+            async def events():
+                chunks = [page[i:i + 256] for i in range(0, len(page), 256)]
+                for chunk in chunks:
+                    await asyncio.sleep(latency / len(chunks))
+                    yield f"data: {json.dumps({'choices': [{'delta': {'content': chunk}}]})}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(latency)
+        return {
+            "id": f"chatcmpl-{rng.getrandbits(64):x}",
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": page}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    # GitHub REST
+
+    @app.post("/user/repos", status_code=201)
+    async def create_repo(request: Request):
+        body = await request.json()
+        await github_delay()
+        name = body["name"]
+        if os.path.isdir(repo_path(args.owner, name)):
+            raise HTTPException(status_code=422, detail="name already exists on this account")
+        # Always initialised, so both publish backends have a branch to work on
+        await asyncio.to_thread(init_repo, repo_path(args.owner, name), args.branch)
+        return repo_json(args.owner, name)
+
+    @app.get("/user")
+    async def get_user():
+        await github_delay()
+        return {"login": args.owner}
+
+    @app.get("/repos/{owner}/{name}")
+    async def get_repo(owner: str, name: str):
+        await github_delay()
+        return repo_json(owner, name)
+
+    @app.post("/repos/{owner}/{name}/pages", status_code=201)
+    async def enable_pages(owner: str, name: str):
+        await github_delay()
+        existing_repo(owner, name)
+        return {"url": f"{args.public_url}/repos/{owner}/{name}/pages", "status": "queued",
+                "html_url": f"https://{owner}.github.io/{name}/", "source": {"branch": args.branch, "path": "/"}}
+
+    @app.get("/repos/{owner}/{name}/git/ref/heads/{branch}")
+    async def get_ref(owner: str, name: str, branch: str):
+        await github_delay()
+        path = existing_repo(owner, name)
+        try:
+            sha = await asyncio.to_thread(git, path, "rev-parse", "--verify", f"refs/heads/{branch}")
+        except HTTPException:
+            raise HTTPException(status_code=404, detail="Not Found")
+        return {"ref": f"refs/heads/{branch}", "object": {"sha": sha, "type": "commit"}}
+
+    @app.post("/repos/{owner}/{name}/git/refs", status_code=201)
+    async def create_ref(owner: str, name: str, request: Request):
+        body = await request.json()
+        await github_delay()
+        path = existing_repo(owner, name)
+        await asyncio.to_thread(git, path, "update-ref", body["ref"], body["sha"], "")
+        return {"ref": body["ref"], "object": {"sha": body["sha"], "type": "commit"}}
+
+    @app.patch("/repos/{owner}/{name}/git/refs/heads/{branch}")
+    async def update_ref(owner: str, name: str, branch: str, request: Request):
+        body = await request.json()
+        await github_delay()
+        path = existing_repo(owner, name)
+        await asyncio.to_thread(git, path, "update-ref", f"refs/heads/{branch}", body["sha"])
+        return {"ref": f"refs/heads/{branch}", "object": {"sha": body["sha"], "type": "commit"}}
+
+    @app.get("/repos/{owner}/{name}/git/commits/{sha}")
+    async def get_commit(owner: str, name: str, sha: str):
+        await github_delay()
+        path = existing_repo(owner, name)
+        tree = await asyncio.to_thread(git, path, "rev-parse", f"{sha}^{{tree}}")
+        return {"sha": sha, "tree": {"sha": tree}}
+
+    @app.post("/repos/{owner}/{name}/git/blobs", status_code=201)
+    async def create_blob(owner: str, name: str, request: Request):
+        body = await request.json()
+        await github_delay()
+        path = existing_repo(owner, name)
+        content = base64.b64decode(body["content"]) if body.get("encoding") == "base64" else body["content"].encode("utf-8")
+        sha = await asyncio.to_thread(git, path, "hash-object", "-w", "--stdin", input=content)
+        return {"sha": sha}
+
+    @app.post("/repos/{owner}/{name}/git/trees", status_code=201)
+    async def create_tree(owner: str, name: str, request: Request):
+        body = await request.json()
+        await github_delay()
+        path = existing_repo(owner, name)
+        sha = await asyncio.to_thread(write_tree, path, body.get("base_tree"), body.get("tree", []))
+        return {"sha": sha}
+
+    @app.post("/repos/{owner}/{name}/git/commits", status_code=201)
+    async def create_commit(owner: str, name: str, request: Request):
+        body = await request.json()
+        await github_delay()
+        path = existing_repo(owner, name)
+        parents = [arg for parent in body.get("parents", []) for arg in ("-p", parent)]
+        sha = await asyncio.to_thread(git, path, "commit-tree", body["tree"], *parents, "-m", body.get("message", ""), env=_commit_env())
+        return {"sha": sha, "tree": {"sha": body["tree"]}}
+
+    # Evaluator
+
+    @app.post("/evaluate")
+    async def evaluate(request: Request):
+        body = await request.json()
+        if args.evaluator_latency:
+            await asyncio.sleep(args.evaluator_latency)
+        if args.evaluator_error_rate and rng.random() < args.evaluator_error_rate:
+            return JSONResponse({"detail": "Simulated failure"}, status_code=503)
+        evaluations.append({"received_at": time.time(), "nonce": body.get("nonce"), "task": body.get("task"), "round": body.get("round")})
+        return {"status": "ok"}
+
+    @app.get("/evaluations")
+    async def list_evaluations():
+        return {"count": len(evaluations), "received": evaluations}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="mean seconds per completion")
+    parser.add_argument("--llm-jitter", type=float, default=0.5, help="uniform +/- seconds around the mean")
+    parser.add_argument("--llm-chars", type=int, default=4000, help="size of the generated page")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of completions answered with 503")
+    parser.add_argument("--github-latency", type=float, default=0.05, help="seconds per GitHub API call")
+    parser.add_argument("--evaluator-latency", type=float, default=0.0)
+    parser.add_argument("--evaluator-error-rate", type=float, default=0.0)
+    parser.add_argument("--owner", default="loadtest")
+    parser.add_argument("--branch", default="main")
+    parser.add_argument("--repo-root", default=os.path.join(tempfile.gettempdir(), "fake-github"))
+    parser.add_argument("--keep-repos", action="store_true", help="do not wipe --repo-root on start")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    args.public_url = f"http://{args.host}:{args.port}"
+
+    if not args.keep_repos:
+        shutil.rmtree(args.repo_root, ignore_errors=True)
+    os.makedirs(args.repo_root, exist_ok=True)
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
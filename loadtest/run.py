@@ -0,0 +1,163 @@
+"""
+Load generator for /api-endpoint. Submits round-1 jobs at a fixed rate
+(open loop: a slow server does not slow down the arrivals), optionally
+follows each finished task with its round 2, polls /jobs/{nonce} until every
+job has finished and reports p50/p95/p99 per pipeline stage and jobs/sec.
+
+    python loadtest/run.py [--rate 1] [--jobs 20] [--round2] [--attachment-rows 1000] [--app http://127.0.0.1:8000] [--fakes http://127.0.0.1:9000]
+
+Meant to run against an app whose upstreams point at loadtest/fakes.py.
+"""
+import argparse
+import asyncio
+import base64
+import os
+import time
+import uuid
+
+import httpx
+
+TERMINAL = ("succeeded", "failed")
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def csv_attachment(rows):
+    lines = ["id,region,units,price"] + [f"{i},region {i % 7},{i % 100},{i * 0.37:.2f}" for i in range(rows)]
+    data = base64.b64encode("\n".join(lines).encode()).decode("ascii")
+    return {"name": "data.csv", "url": f"data:text/csv;base64,{data}"}
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.run_id = uuid.uuid4().hex[:6]
+        self.attachments = [csv_attachment(args.attachment_rows)] if args.attachment_rows else []
+        self.jobs = []
+        self.rejected = 0
+        self.started = None
+
+    def payload(self, index, round):
+        return {
+            "email": "loadtest@example.com",
+            "secret": self.args.secret,
+            "task": f"lt-{self.run_id}-{index}",
+            "round": round,
+            "nonce": f"{self.run_id}-{index}-r{round}",
+            "brief": f"Load test app {index}, round {round}: show the attachment as a sortable table",
+            "evaluation_url": f"{self.args.fakes}/evaluate",
+            "attachments": self.attachments,
+            "bypass_cache": not self.args.cache,
+        }
+
+    async def submit(self, client, index, round):
+        payload = self.payload(index, round)
+        sent = time.time()
+        r = await client.post(f"{self.args.app}/api-endpoint", json=payload)
+        if r.status_code == 503:
+            self.rejected += 1
+            return None
+        r.raise_for_status()
+        job = {"nonce": payload["nonce"], "round": round, "index": index, "sent": sent, "status": None}
+        self.jobs.append(job)
+        return job
+
+    async def wait(self, client, job):
+        deadline = time.time() + self.args.timeout
+        while time.time() < deadline:
+            r = await client.get(f"{self.args.app}/jobs/{job['nonce']}")
+            if r.status_code == 200 and r.json()["state"] in TERMINAL:
+                job["status"] = r.json()
+                job["done"] = time.time()
+                return job
+            await asyncio.sleep(self.args.poll)
+        job["status"] = {"state": "timeout"}
+        return job
+
+    async def follow(self, client, index):
+        job = await self.submit(client, index, 1)
+        if job is None:
+            return
+        await self.wait(client, job)
+        if self.args.round2 and job["status"]["state"] == "succeeded":
+            job = await self.submit(client, index, 2)
+            if job is not None:
+                await self.wait(client, job)
+
+    async def run(self):
+        limits = httpx.Limits(max_connections=200, max_keepalive_connections=50)
+        async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+            self.started = time.time()
+            tasks = []
+            for index in range(self.args.jobs):
+                # Arrivals are scheduled from the start time, not from the previous response
+                delay = self.started + index / self.args.rate - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(self.follow(client, index)))
+            await asyncio.gather(*tasks)
+            self.finished = time.time()
+            try:
+                r = await client.get(f"{self.args.fakes}/evaluations")
+                self.evaluations = {e["nonce"]: e["received_at"] for e in r.json()["received"]}
+            except httpx.HTTPError:
+                self.evaluations = {}
+
+    def report(self):
+        elapsed = self.finished - self.started
+        print(f"run {self.run_id}: {self.args.jobs} tasks at {self.args.rate}/s, {elapsed:.1f}s wall, {self.rejected} rejected (503)")
+        for round in (1, 2):
+            jobs = [j for j in self.jobs if j["round"] == round]
+            if not jobs:
+                continue
+            states = {}
+            for j in jobs:
+                states[j["status"]["state"]] = states.get(j["status"]["state"], 0) + 1
+            ok = [j for j in jobs if j["status"]["state"] == "succeeded"]
+            print(f"\nround {round}: {len(jobs)} jobs, " + ", ".join(f"{n} {s}" for s, n in sorted(states.items()))
+                  + f", {len(ok) / elapsed:.2f} jobs/s")
+            if not ok:
+                continue
+
+            samples = {}
+            for j in ok:
+                for stage, timing in j["status"]["result"]["stages"].items():
+                    if timing.get("seconds") is not None:
+                        samples.setdefault(stage, []).append(timing["seconds"])
+                status = j["status"]
+                samples.setdefault("queue_wait", []).append(status["started_at"] - status["submitted_at"])
+                samples.setdefault("end_to_end", []).append(j["done"] - j["sent"])
+                if j["nonce"] in self.evaluations:
+                    samples.setdefault("evaluator", []).append(self.evaluations[j["nonce"]] - j["sent"])
+
+            print(f"{'stage':14}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+            for stage, values in samples.items():
+                print(f"{stage:14}{len(values):>6}" + "".join(f"{percentile(values, q):>9.3f}" for q in (50, 95, 99)) + f"{max(values):>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app", default="http://127.0.0.1:8000")
+    parser.add_argument("--fakes", default="http://127.0.0.1:9000", help="base URL of loadtest/fakes.py (evaluator sink)")
+    parser.add_argument("--secret", default=os.getenv("SERVER_SECRET", ""))
+    parser.add_argument("--rate", type=float, default=1.0, help="round-1 submissions per second")
+    parser.add_argument("--jobs", type=int, default=20, help="number of tasks")
+    parser.add_argument("--round2", action="store_true", help="send round 2 for each task once round 1 succeeds")
+    parser.add_argument("--attachment-rows", type=int, default=0, help="attach a CSV with this many rows")
+    parser.add_argument("--cache", action="store_true", help="allow LLM cache hits (bypass_cache=false)")
+    parser.add_argument("--poll", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=600, help="seconds to wait for each job")
+    args = parser.parse_args()
+
+    test = LoadTest(args)
+    asyncio.run(test.run())
+    test.report()
+
+
+if __name__ == "__main__":
+    main()